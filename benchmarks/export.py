@@ -0,0 +1,62 @@
+"""
+Throughput of the streaming export (`src/export.py`) in features per second, for every layer of a saved
+(memory-mapped) map, with the peak memory of the export measured with tracemalloc in a second pass.
+
+Usage:
+    python -m benchmarks.export [--N 100000] [--seed 0] [--format ndjson] [--precision 6] [--no-memory]
+"""
+from __future__ import absolute_import
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import *
+
+from src import export, storage
+from src.pipeline import Pipeline
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    parser = argparse.ArgumentParser(description='Throughput of the streaming export.')
+    parser.add_argument('--N', type=int, default=100000, help='number of polygons')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', default='ndjson', choices=export.FORMATS)
+    parser.add_argument('--precision', type=int, default=None)
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the peak memory")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        storage.save(Pipeline(seed=args.seed, N=args.N).run(), os.path.join(directory, 'map'))
+        arrays = storage.load(os.path.join(directory, 'map')).arrays
+        out = os.path.join(directory, 'features')
+
+        for layer in export.LAYERS:
+            start = time.perf_counter()
+            count = export.export(arrays, out, [layer], args.format, args.precision)
+            seconds = time.perf_counter() - start
+            results[layer] = {
+                'features': count,
+                'seconds': seconds,
+                'features_per_second': count / seconds,
+                'bytes': os.path.getsize(out),
+            }
+            if not args.no_memory:
+                tracemalloc.start()
+                try:
+                    export.export(arrays, out, [layer], args.format, args.precision)
+                    results[layer]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+
+            measured = results[layer]
+            peak = f' {measured["peak_bytes"] / 2 ** 20:8.1f} MiB peak' if 'peak_bytes' in measured else ''
+            print(f'{layer:>10} {measured["features"]:9d} features {measured["seconds"]:8.3f}s '
+                  f'{measured["features_per_second"]:10.0f} features/s {measured["bytes"] / 2 ** 20:8.1f} MiB{peak}',
+                  flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    main()
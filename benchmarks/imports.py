@@ -0,0 +1,80 @@
+"""
+Cold-start benchmark: time of importing the generation modules in a fresh interpreter, and a check that
+they don't import the plotting libraries (which are needed only by `src.render`).
+
+Usage:
+    python -m benchmarks.imports [--budget 1.0] [--repeat 5] [--json results.json]
+
+Exits with 1 when an import takes longer than the budget or imports a plotting library.
+"""
+from __future__ import absolute_import
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import *
+
+# The modules of the generation core and the tools built on it, none of them may need the plotting libraries.
+MODULES = ('src.voronoi', 'src.map', 'src.pipeline', 'src.storage', 'src.tiles', 'src.batch')
+PLOTTING = ('matplotlib', 'plotly')
+DEFAULT_BUDGET = 1.0
+
+_SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+plotting = sorted({{name.split('.')[0] for name in sys.modules}} & set({plotting!r}))
+print(json.dumps({{'seconds': seconds, 'plotting': plotting}}))
+'''
+
+
+def measure(module: str, repeat: int) -> Dict[str, Any]:
+    """
+    The shortest of `repeat` import times of the module (in seconds, each in a new interpreter)
+    and the plotting libraries it imported.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = _SCRIPT.format(module=module, plotting=PLOTTING)
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output))
+    return {'seconds': min(run['seconds'] for run in runs), 'plotting': runs[0]['plotting']}
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Import time of the generation modules.')
+    parser.add_argument('--modules', nargs='+', default=list(MODULES))
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET, help='seconds allowed for every import')
+    parser.add_argument('--repeat', type=int, default=5, help='imports of every module, the shortest one is reported')
+    parser.add_argument('--json', default=None, help='path of the JSON report')
+    args = parser.parse_args(argv)
+
+    results = {}
+    failed = False
+    for module in args.modules:
+        results[module] = measure(module, args.repeat)
+        seconds, plotting = results[module]['seconds'], results[module]['plotting']
+        problems = []
+        if seconds > args.budget:
+            problems.append(f'over the budget of {args.budget}s')
+        if plotting:
+            problems.append(f'imports {", ".join(plotting)}')
+        failed = failed or bool(problems)
+        print(f'{module:>14} {seconds:8.3f}s  {"; ".join(problems) or "ok"}', flush=True)
+
+    report = {'python': sys.version.split()[0], 'budget': args.budget, 'results': results}
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        sys.exit(1)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Memory taken by the object graph (Center, Corner and Edge objects), measured with tracemalloc.
+
+Usage:
+    python -m benchmarks.memory [N ...]
+"""
+from __future__ import absolute_import
+import sys
+import tracemalloc
+import numpy as np
+
+from src.arrays import ArrayGraph
+from src.map import Graph
+from src.voronoi import VoronoiPolygons
+
+
+DEFAULT_SIZES = (10_000, 100_000)
+
+
+def build_arrays(N: int, seed: int = 0) -> ArrayGraph:
+    np.random.seed(seed)
+    voronoi_polygons = VoronoiPolygons(N=N)
+    points, _, vertices, regions, neighbors, intersecions = voronoi_polygons.generate_Voronoi(iterations=0)
+    return ArrayGraph.from_voronoi(points, vertices, regions, neighbors, intersecions)
+
+
+def object_graph_bytes(arrays: ArrayGraph) -> int:
+    """
+    Bytes allocated (and still alive) while creating the object graph over `arrays`.
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        graph = Graph.from_arrays(arrays)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del graph
+    return after - before
+
+
+def main(sizes=DEFAULT_SIZES):
+    print(f'{"N":>10} {"centers":>10} {"corners":>10} {"edges":>10} {"bytes/cell":>12} {"arrays/cell":>12}')
+    for N in sizes:
+        arrays = build_arrays(N)
+        total = object_graph_bytes(arrays)
+        arrays_bytes = sum(value.nbytes for value in vars(arrays).values() if isinstance(value, np.ndarray))
+        print(
+            f'{N:>10} {arrays.n_centers:>10} {arrays.n_corners:>10} {arrays.n_edges:>10} '
+            f'{total / arrays.n_centers:>12.0f} {arrays_bytes / arrays.n_centers:>12.0f}'
+        )
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
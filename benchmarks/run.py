@@ -0,0 +1,176 @@
+"""
+Scaling benchmark of every stage of the pipeline: times (and peak memory, measured with tracemalloc in a second pass)
+of the stages over a sweep of N, with the exponents k of the fitted time ~ N^k.
+
+Usage:
+    python -m benchmarks.run [--sizes 1000 2000 5000 ...] [--seed 0] [--json results.json] [--no-memory] [--legacy]
+"""
+from __future__ import absolute_import
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+from scipy.spatial import Voronoi
+from typing import *
+
+from src.arrays import ArrayGraph
+from src.map import Graph
+from src.pipeline import STAGES
+from src.rng import stage_seeds
+from src.voronoi import VoronoiPolygons
+
+
+DEFAULT_SIZES = (1000, 2000, 5000, 10000)
+# The quadratic legacy neighbours (`neighbours_method='intersections'`) are only run up to this size.
+LEGACY_MAX_N = 500
+# The relaxation iterations of `Graph` by default.
+RELAXATION_ITERATIONS = 2
+
+
+def stages(N: int, seed: int, legacy: bool = False) -> List[Tuple[str, Callable[[Dict[str, Any]], None]]]:
+    """
+    The stages of the pipeline as (name, function), every function takes the state left by the previous ones.
+    """
+    def points(state):
+        rng = np.random.default_rng(stage_seeds(seed)['points'])
+        state['voronoi'] = VoronoiPolygons(N=N, rng=rng)
+        state['points'] = state['voronoi'].points
+
+    def relaxation(state):
+        # The vertex-mean centroids of `VoronoiPolygons.generate_Voronoi`, used by `Graph` by default.
+        for _ in range(RELAXATION_ITERATIONS):
+            _, _, state['points'] = VoronoiPolygons.find_new_polygons(vor=Voronoi(state['points']))
+
+    def area_relaxation(state):
+        # The area-weighted centroids of `relaxation_tolerance`, from the same points. The next stages don't use them.
+        state['voronoi'].relax(iterations=RELAXATION_ITERATIONS)
+
+    def clipping(state):
+        state['vor'] = Voronoi(state['points'])
+        state['regions'], state['vertices'], _ = VoronoiPolygons.find_new_polygons(vor=state['vor'])
+
+    def adjacency(state):
+        state['neighbors'], state['intersecions'] = VoronoiPolygons.generate_neighbours_from_ridges(
+            vor=state['vor'], regions=state['regions'], vertices=state['vertices'],
+        )
+
+    def legacy_adjacency(state):
+        VoronoiPolygons.generate_neighbours(vor=state['vor'], regions=state['regions'], vertices=state['vertices'])
+
+    def arrays(state):
+        state['arrays'] = ArrayGraph.from_voronoi(
+            state['vor'].points, state['vertices'], state['regions'], state['neighbors'], state['intersecions'],
+        )
+
+    def initialize_graph(state):
+        state['graph'] = Graph.from_arrays(state['arrays'], seed=seed)
+
+    def pipeline_stage(name):
+        def run(state):
+            STAGES[name].run(state['graph'], **STAGES[name].defaults)
+        return run
+
+    def rendering(state):
+        state['graph'].render('biome', 1024)
+
+    result = [
+        ('points', points), ('relaxation', relaxation), ('area_relaxation', area_relaxation),
+        ('clipping', clipping), ('adjacency', adjacency),
+    ]
+    if legacy and N <= LEGACY_MAX_N:
+        result.append(('legacy_adjacency', legacy_adjacency))
+    result += [('arrays', arrays), ('initialize_graph', initialize_graph)]
+    result += [(name, pipeline_stage(name)) for name in ('terrain', 'elevation', 'rivers', 'moisture', 'biomes')]
+    result.append(('rendering', rendering))
+    return result
+
+
+def measure(N: int, seed: int, memory: bool, legacy: bool = False) -> Dict[str, Dict[str, float]]:
+    """
+    Seconds (and peak bytes allocated, with `memory`) of every stage for the given N.
+    """
+    results = {}
+    state = {}
+    for name, run in stages(N, seed, legacy):
+        start = time.perf_counter()
+        run(state)
+        results[name] = {'seconds': time.perf_counter() - start}
+
+    if memory:
+        state = {}
+        for name, run in stages(N, seed, legacy):
+            tracemalloc.start()
+            try:
+                run(state)
+                results[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return results
+
+
+def scaling_exponents(sizes: Sequence[int], results: Dict[int, Dict[str, Dict[str, float]]]) -> Dict[str, float]:
+    """
+    Slope of log(seconds) against log(N) of every stage measured for at least two sizes.
+    """
+    exponents = {}
+    names = {name for by_stage in results.values() for name in by_stage}
+    for name in sorted(names):
+        measured = [(N, results[N][name]['seconds']) for N in sizes if name in results[N]]
+        if len(measured) >= 2:
+            ns, seconds = np.array(measured).T
+            exponents[name] = float(np.polyfit(np.log(ns), np.log(np.maximum(seconds, 1e-9)), 1)[0])
+    return exponents
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the stages of the pipeline.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help='values of N')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='path of the JSON report')
+    parser.add_argument('--no-memory', action='store_true', help="don't measure the peak memory")
+    parser.add_argument('--legacy', action='store_true', help=f'also time the quadratic neighbours up to N={LEGACY_MAX_N}')
+    args = parser.parse_args(argv)
+
+    sizes = sorted(args.sizes)
+    results = {}
+    for N in sizes:
+        results[N] = measure(N, args.seed, memory=not args.no_memory, legacy=args.legacy)
+        print(f'N={N}')
+        for name, measured in results[N].items():
+            peak = f' {measured["peak_bytes"] / 2 ** 20:10.1f} MiB' if 'peak_bytes' in measured else ''
+            print(f'  {name:>18} {measured["seconds"]:10.4f}s{peak}', flush=True)
+
+    exponents = scaling_exponents(sizes, results)
+    print('time ~ N^k')
+    for name, exponent in exponents.items():
+        print(f'  {name:>18} k={exponent:.2f}')
+
+    report = {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'seed': args.seed,
+        'sizes': sizes,
+        'results': {str(N): by_stage for N, by_stage in results.items()},
+        'exponents': exponents,
+    }
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
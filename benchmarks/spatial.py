@@ -0,0 +1,47 @@
+"""
+Throughput of the spatial queries (`src/spatial.py`) in lookups per second: the cell containing a position
+and the nearest corner and edge of every set, for a batch of random positions on a generated map.
+
+Usage:
+    python -m benchmarks.spatial [--N 10000] [--seed 0] [--queries 1000000]
+"""
+from __future__ import absolute_import
+import argparse
+import time
+import numpy as np
+from typing import *
+
+from src.pipeline import Pipeline
+from src.spatial import CORNER_SETS, EDGE_SETS
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, float]:
+    parser = argparse.ArgumentParser(description='Throughput of the spatial queries.')
+    parser.add_argument('--N', type=int, default=10000, help='number of polygons')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--queries', type=int, default=1000000, help='positions in the batch')
+    parser.add_argument('--sampling', default='poisson', choices=('uniform', 'poisson'))
+    args = parser.parse_args(argv)
+
+    graph = Pipeline(seed=args.seed, N=args.N, sampling=args.sampling, iterations=0).run()
+    start = time.perf_counter()
+    index = graph.spatial_index()
+    print(f'{"index":>18} {time.perf_counter() - start:8.3f}s')
+    positions = np.random.default_rng(args.seed).random((args.queries, 2))
+
+    queries = [('cell', index.cell)]
+    queries += [(f'corner {which}', lambda p, which=which: index.nearest_corner(p, which)) for which in CORNER_SETS]
+    queries += [(f'edge {which}', lambda p, which=which: index.nearest_edge(p, which)) for which in EDGE_SETS]
+    results = {}
+    for name, query in queries:
+        # The first query builds the index of the set.
+        query(positions[:1])
+        start = time.perf_counter()
+        query(positions)
+        results[name] = len(positions) / (time.perf_counter() - start)
+        print(f'{name:>18} {results[name]:12.0f} lookups/s', flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,562 @@
+from __future__ import absolute_import
+import logging
+import numpy as np
+from typing import *
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import Delaunay
+
+from src.terrain import TerrainType, BiomeType, BIOME_TABLE, classify_biomes
+
+logger = logging.getLogger(__name__)
+
+
+INDEX_DTYPE = np.int32
+
+# Attribute columns of the graph: name -> (dtype, Graph collection, object attribute, default value).
+COLUMNS = {
+    'center_terrain': (np.int8, 'centers', 'terrain_type', TerrainType.LAND.value),
+    'center_biome': (np.int8, 'centers', 'biome', BiomeType.OCEAN.value),
+    'center_height': (np.float64, 'centers', 'height', 0.0),
+    'center_moisture': (np.float64, 'centers', 'moisture', 0.0),
+    'corner_terrain': (np.int8, 'corners', 'terrain_type', TerrainType.LAND.value),
+    'corner_height': (np.float64, 'corners', 'height', 0.0),
+    'corner_moisture': (np.float64, 'corners', 'moisture', 0.0),
+    'corner_river': (np.int32, 'corners', 'river', 0),
+    # Index of the lowest corner in `corner_adjacent` of the corner (as Corner.downslope), -1 when there is none.
+    'corner_downslope': (np.int32, 'corners', 'downslope', -1),
+    'edge_river': (np.int32, 'edges', 'river', 0),
+}
+
+# CSR adjacency lists: name -> (Graph collection, object attribute, Graph collection of the elements).
+ADJACENCY = {
+    'center_neighbors': ('centers', 'neighbors', 'centers'),
+    'center_borders': ('centers', 'borders', 'edges'),
+    'center_corners': ('centers', 'corners', 'corners'),
+    'corner_touches': ('corners', 'touches', 'centers'),
+    'corner_adjacent': ('corners', 'adjacent', 'corners'),
+    'corner_protrudes': ('corners', 'protrudes', 'edges'),
+}
+
+_TERRAIN_TYPES = {terrain_type.value: terrain_type for terrain_type in TerrainType}
+_BIOME_TYPES = {biome.value: biome for biome in BiomeType}
+
+
+def _csr(rows: np.ndarray, values: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Builds CSR (indptr, indices) arrays from (row, value) pairs, keeping the order of the pairs within each row.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(rows, minlength=n_rows))
+    return indptr, np.asarray(values, dtype=INDEX_DTYPE)[order]
+
+
+def _row_ids(indptr: np.ndarray) -> np.ndarray:
+    """
+    Row of every entry of a CSR array.
+    """
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+def _row_entries(indptr: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Positions of the entries of the given rows of a CSR array, row after row.
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+
+def _encode(name: str, values: list) -> list:
+    if name.endswith('_terrain') or name.endswith('_biome'):
+        return [value.value for value in values]
+    if name == 'corner_downslope':
+        return [-1 if value is None else value for value in values]
+    return values
+
+
+def _decode(name: str, values: list) -> list:
+    if name.endswith('_terrain'):
+        return [_TERRAIN_TYPES[value] for value in values]
+    if name.endswith('_biome'):
+        return [_BIOME_TYPES[value] for value in values]
+    if name == 'corner_downslope':
+        return [None if value < 0 else value for value in values]
+    return values
+
+
+class ArrayGraph:
+    """
+    Struct-of-arrays representation of the map graph.
+
+    Centers, corners and edges are identified by their index. Adjacency lists are stored as CSR pairs,
+    e.g. the neighbors of the i-th center are `center_neighbors[center_neighbors_indptr[i]:center_neighbors_indptr[i + 1]]`,
+    and attributes (terrain, biome, height, ...) as typed columns, see `COLUMNS` and `ADJACENCY`.
+    The rows of `corner_adjacent` and `corner_protrudes` are aligned: the k-th adjacent corner is the other
+    end of the k-th protruding edge.
+    The polygon of the i-th center (including the corners of the map, which are not corners of the graph)
+    is `polygon_xy[polygon_indptr[i]:polygon_indptr[i + 1]]`.
+    """
+
+    def __init__(self, center_xy: np.ndarray, corner_xy: np.ndarray, **arrays):
+        self.center_xy = np.asarray(center_xy, dtype=np.float64)
+        self.corner_xy = np.asarray(corner_xy, dtype=np.float64)
+        self.polygon_xy = np.asarray(arrays.pop('polygon_xy'), dtype=np.float64)
+        self.polygon_indptr = np.asarray(arrays.pop('polygon_indptr'), dtype=np.int64)
+        for name in ('edge_d0', 'edge_d1', 'edge_v0', 'edge_v1'):
+            setattr(self, name, np.asarray(arrays.pop(name), dtype=INDEX_DTYPE))
+        for name in ADJACENCY:
+            setattr(self, f'{name}_indptr', np.asarray(arrays.pop(f'{name}_indptr'), dtype=np.int64))
+            setattr(self, name, np.asarray(arrays.pop(name), dtype=INDEX_DTYPE))
+
+        sizes = {'centers': self.n_centers, 'corners': self.n_corners, 'edges': self.n_edges}
+        for name, (dtype, collection, _, default) in COLUMNS.items():
+            column = arrays.pop(name, None)
+            if column is None:
+                column = np.full(sizes[collection], default, dtype=dtype)
+            setattr(self, name, np.asarray(column, dtype=dtype))
+
+        if arrays:
+            raise ValueError(f'Unexpected arrays: {sorted(arrays)}')
+        # `GenerationStats` recording the counters of the stages, None when they are not recorded.
+        self.stats = None
+
+    @property
+    def n_centers(self) -> int:
+        return len(self.center_xy)
+
+    @property
+    def n_corners(self) -> int:
+        return len(self.corner_xy)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_d0)
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        All the arrays by name, `ArrayGraph(**arrays.to_dict())` is a copy of `arrays` sharing its arrays.
+        """
+        names = ['center_xy', 'corner_xy', 'polygon_xy', 'polygon_indptr', 'edge_d0', 'edge_d1', 'edge_v0', 'edge_v1']
+        for name in ADJACENCY:
+            names += [f'{name}_indptr', name]
+        return {name: getattr(self, name) for name in names + list(COLUMNS)}
+
+    @classmethod
+    def from_voronoi(
+        cls,
+        points: np.ndarray,
+        vertices: np.ndarray,
+        regions: List[List[int]],
+        neighbors: List[List[int]],
+        intersecions: List[List[Tuple[int, int]]],
+    ) -> 'ArrayGraph':
+        """
+        Builds the graph from the output of `VoronoiPolygons.generate_Voronoi`.
+        The order of every adjacency list is the same as in the object graph built by the original `Graph.initialize_graph`.
+        """
+        n_centers = len(points)
+        vertices = np.asarray(vertices)
+        xs, ys = vertices[:, 0], vertices[:, 1]
+
+        # Corners of the [0, 1]^2 square and vertices outside of it are not corners of the graph.
+        corners_inside = (0 <= xs) & (xs <= 1) & (0 <= ys) & (ys <= 1) \
+            & ~(((xs == 0) | (xs == 1)) & ((ys == 0) | (ys == 1)))
+        corner_ids = np.full(len(vertices), -1, dtype=np.int64)
+        corner_ids[corners_inside] = np.arange(corners_inside.sum())
+        n_corners = int(corners_inside.sum())
+
+        region_centers = np.repeat(np.arange(n_centers), [len(region) for region in regions])
+        region_vertices = np.fromiter((v for region in regions for v in region), dtype=np.int64,
+                                      count=len(region_centers))
+        inside = corners_inside[region_vertices]
+        center_corners = _csr(region_centers[inside], corner_ids[region_vertices[inside]], n_centers)
+        corner_touches = _csr(corner_ids[region_vertices[inside]], region_centers[inside], n_corners)
+
+        # Every pair of neighbors gets a single edge, made when the pair is seen for the first time.
+        sources = np.repeat(np.arange(n_centers), [len(n_list) for n_list in neighbors])
+        targets = np.fromiter((c for n_list in neighbors for c in n_list), dtype=np.int64, count=len(sources))
+        separators = np.array([pair for i_list in intersecions for pair in i_list], dtype=np.int64).reshape(-1, 2)
+        pairs = np.minimum(sources, targets) * n_centers + np.maximum(sources, targets)
+        _, first = np.unique(pairs, return_index=True)
+        first.sort()
+        edge_v0, edge_v1 = corner_ids[separators[first, 0]], corner_ids[separators[first, 1]]
+        # Edges ending in a corner of the square (which is not a corner of the graph) are degenerate, skip them.
+        first = first[(edge_v0 >= 0) & (edge_v1 >= 0)]
+        edge_d0, edge_d1 = sources[first], targets[first]
+        edge_v0, edge_v1 = corner_ids[separators[first, 0]], corner_ids[separators[first, 1]]
+        edge_ids = np.repeat(np.arange(len(first)), 2)
+
+        center_borders = _csr(np.column_stack([edge_d0, edge_d1]).ravel(), edge_ids, n_centers)
+        corner_protrudes = _csr(np.column_stack([edge_v0, edge_v1]).ravel(), edge_ids, n_corners)
+        corner_adjacent = _csr(
+            np.column_stack([edge_v0, edge_v1]).ravel(), np.column_stack([edge_v1, edge_v0]).ravel(), n_corners,
+        )
+        center_neighbors = _csr(sources, targets, n_centers)
+
+        arrays = {}
+        for name, (indptr, indices) in (
+            ('center_neighbors', center_neighbors),
+            ('center_borders', center_borders),
+            ('center_corners', center_corners),
+            ('corner_touches', corner_touches),
+            ('corner_adjacent', corner_adjacent),
+            ('corner_protrudes', corner_protrudes),
+        ):
+            arrays[f'{name}_indptr'] = indptr
+            arrays[name] = indices
+
+        polygon_indptr = np.zeros(n_centers + 1, dtype=np.int64)
+        polygon_indptr[1:] = np.cumsum([len(region) for region in regions])
+
+        return cls(
+            center_xy=points,
+            corner_xy=vertices[corners_inside],
+            polygon_xy=vertices[region_vertices],
+            polygon_indptr=polygon_indptr,
+            edge_d0=edge_d0,
+            edge_d1=edge_d1,
+            edge_v0=edge_v0,
+            edge_v1=edge_v1,
+            **arrays,
+        )
+
+    def row(self, name: str, i: int) -> np.ndarray:
+        """
+        Returns the i-th adjacency list of the `name` CSR array, e.g. `row('center_neighbors', 0)`.
+        """
+        indptr = getattr(self, f'{name}_indptr')
+        return getattr(self, name)[indptr[i]:indptr[i + 1]]
+
+    def pull(self, graph, *columns: str) -> None:
+        """
+        Copies the given attribute columns (all of them by default) from the objects of `graph`.
+        """
+        for name in columns or COLUMNS:
+            dtype, collection, attribute, _ = COLUMNS[name]
+            values = [getattr(element, attribute) for element in getattr(graph, collection)]
+            setattr(self, name, np.array(_encode(name, values), dtype=dtype))
+
+    def push(self, graph, *columns: str) -> None:
+        """
+        Copies the given attribute columns (all of them by default) to the objects of `graph`.
+        """
+        for name in columns or COLUMNS:
+            _, collection, attribute, _ = COLUMNS[name]
+            values = _decode(name, getattr(self, name).tolist())
+            for element, value in zip(getattr(graph, collection), values):
+                setattr(element, attribute, value)
+
+    def is_water(self, terrain: np.ndarray) -> np.ndarray:
+        return (terrain == TerrainType.OCEAN.value) | (terrain == TerrainType.LAKE.value)
+
+    def assign_corner_elevations(self) -> None:
+        """
+        Sets `corner_height` to the distance from the border of the map, where every step between adjacent corners
+        costs 0.01, plus 1 when none of the corners is water. Lake corners are lowered by 1.
+
+        All the border corners are the sources of a single Dijkstra run. The steps are counted in hundredths,
+        so the distances are exact integers.
+        """
+        xs, ys = self.corner_xy[:, 0], self.corner_xy[:, 1]
+        border_corners = np.flatnonzero((xs == 0) | (xs == 1) | (ys == 0) | (ys == 1))
+        if len(border_corners) == 0:
+            self.corner_height = np.full(self.n_corners, np.inf)
+            return
+
+        land = ~self.is_water(self.corner_terrain)
+        rows = _row_ids(self.corner_adjacent_indptr)
+        steps = np.where(land[rows] & land[self.corner_adjacent], 101.0, 1.0)
+        adjacency = csr_matrix(
+            (steps, self.corner_adjacent, self.corner_adjacent_indptr), shape=(self.n_corners, self.n_corners),
+        )
+
+        distances = dijkstra(adjacency, indices=border_corners, min_only=True)
+        self.corner_height = distances / 100
+        self.corner_height[self.corner_terrain == TerrainType.LAKE.value] -= 1
+
+    def corners_touching(self, terrain_type: TerrainType) -> np.ndarray:
+        """
+        Mask of the corners touching at least one center of the given terrain type.
+        """
+        touching = self.center_terrain[self.corner_touches] == terrain_type.value
+        return np.bincount(_row_ids(self.corner_touches_indptr), weights=touching, minlength=self.n_corners) > 0
+
+    def coastline_edges(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """
+        Indices of the edges between an ocean center and a land (or coast) center, among the edges start:stop.
+        """
+        terrain0 = self.center_terrain[self.edge_d0[start:stop]]
+        terrain1 = self.center_terrain[self.edge_d1[start:stop]]
+        ocean0, ocean1 = terrain0 == TerrainType.OCEAN.value, terrain1 == TerrainType.OCEAN.value
+        land0, land1 = self.is_land(terrain0), self.is_land(terrain1)
+        return np.flatnonzero((ocean0 & land1) | (land0 & ocean1)) + start
+
+    def assign_corner_moisture(self, distance_decay, river_weight, lake_value, ocean_value) -> None:
+        """
+        Sets `corner_moisture`. Rivers and lakes are the sources of the moisture, which is spread to the adjacent
+        corners multiplied by `distance_decay` at every step, so every corner gets the maximum over all the
+        sources of source_moisture * distance_decay^steps. Corners touching the ocean get at least `ocean_value`.
+
+        The moisture is spread from all the corners changed in the previous step at once.
+        """
+        moisture = np.zeros(self.n_corners)
+        river = self.corner_river > 0
+        moisture[river] = np.maximum(1.0, np.minimum(3.0, river_weight * self.corner_river[river]))
+        touches_lake = self.corners_touching(TerrainType.LAKE)
+        moisture[touches_lake] = np.maximum(lake_value, moisture[touches_lake])
+
+        indptr, indices = self.corner_adjacent_indptr, self.corner_adjacent
+        changed = np.flatnonzero(moisture > 0)
+        while len(changed) > 0:
+            entries = _row_entries(indptr, changed)
+            sources = np.repeat(changed, indptr[changed + 1] - indptr[changed])
+            spread = moisture.copy()
+            np.maximum.at(spread, indices[entries], distance_decay * moisture[sources])
+            changed = np.flatnonzero(spread > moisture)
+            moisture = spread
+            if self.stats is not None:
+                self.stats.count('bfs_pushes', len(entries))
+                self.stats.count('bfs_steps')
+
+        touches_ocean = self.corners_touching(TerrainType.OCEAN)
+        moisture[touches_ocean] = np.maximum(ocean_value, moisture[touches_ocean])
+        self.corner_moisture = moisture
+
+    def assign_center_moisture(self) -> None:
+        """
+        Sets `center_moisture` of land and coast centers to the mean of min(1, moisture) of their corners,
+        and of the other centers to 0.
+
+        The centers with the same number of corners are averaged together, as the rows of a single array,
+        so the sums are rounded exactly like `np.mean` of every center alone (which sums pairwise).
+        """
+        counts = np.diff(self.center_corners_indptr)
+        means = np.full(self.n_centers, np.nan)
+        for count in np.unique(counts[counts > 0]).tolist():
+            centers = np.flatnonzero(counts == count)
+            values = np.minimum(1.0, self.corner_moisture[self.center_corners[
+                _row_entries(self.center_corners_indptr, centers)
+            ]])
+            means[centers] = values.reshape(len(centers), count).sum(axis=1) / count
+        land = (self.center_terrain == TerrainType.LAND.value) | (self.center_terrain == TerrainType.COAST.value)
+        self.center_moisture = np.where(land, means, 0.0)
+
+    def redistribute_moisture(self) -> None:
+        """
+        Replaces `center_moisture` with the position of the center in the list of centers sorted by moisture,
+        scaled to [0, 1].
+        """
+        order = np.argsort(self.center_moisture, kind='stable')
+        moisture = np.empty(self.n_centers)
+        moisture[order] = np.arange(self.n_centers) / (self.n_centers - 1)
+        self.center_moisture = moisture
+
+    def assign_moisture(
+        self,
+        redistribute=True,
+        distance_decay=0.9,
+        river_weight=0.25,
+        lake_value=1.0,
+        ocean_value=1.0,
+    ) -> None:
+        self.assign_corner_moisture(distance_decay, river_weight, lake_value, ocean_value)
+        self.assign_center_moisture()
+        if redistribute:
+            self.redistribute_moisture()
+
+    def assign_biomes(self, table=BIOME_TABLE) -> None:
+        """
+        Sets `center_biome` from the terrain, height and moisture of the centers, see `classify_biomes`.
+        """
+        coast = self.center_terrain[self.center_neighbors] == TerrainType.COAST.value
+        coast_neighbour = np.bincount(
+            _row_ids(self.center_neighbors_indptr), weights=coast, minlength=self.n_centers,
+        ) > 0
+        self.center_biome = classify_biomes(
+            self.center_terrain, self.center_height, self.center_moisture, coast_neighbour, table,
+        )
+
+    def is_land(self, terrain: np.ndarray) -> np.ndarray:
+        return (terrain == TerrainType.LAND.value) | (terrain == TerrainType.COAST.value)
+
+    def assign_downslopes(self) -> None:
+        """
+        Sets `corner_downslope` of every land and coast corner to the position of its lowest adjacent corner
+        (the first one, when there are a few), and of the other corners to -1.
+        """
+        rows = _row_ids(self.corner_adjacent_indptr)
+        heights = self.corner_height[self.corner_adjacent]
+        lowest = np.full(self.n_corners, np.inf)
+        np.minimum.at(lowest, rows, heights)
+        is_lowest = heights == lowest[rows]
+        positions = np.arange(len(rows)) - self.corner_adjacent_indptr[rows]
+        first_lowest = np.full(self.n_corners, np.iinfo(np.int32).max)
+        np.minimum.at(first_lowest, rows[is_lowest], positions[is_lowest])
+
+        has_downslope = self.is_land(self.corner_terrain) & (np.diff(self.corner_adjacent_indptr) > 0)
+        self.corner_downslope = np.where(has_downslope, first_lowest, -1).astype(np.int32)
+
+    def river_steps(self, corners: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        For every corner, the corner and the edge a river flowing through it goes to next, -1 where rivers end.
+
+        A river goes down the downslope of a corner only when the corner, all its adjacent corners
+        and the centers it touches are land or coast and the downslope corner is land or coast too.
+        :param corners: if given, the steps are computed only for these corners (and returned in their order)
+        """
+        if corners is None:
+            corners = np.arange(self.n_corners)
+        corners = np.asarray(corners, dtype=np.int64)
+        rows = np.arange(len(corners))
+        adjacent_counts = self.corner_adjacent_indptr[corners + 1] - self.corner_adjacent_indptr[corners]
+        touches_counts = self.corner_touches_indptr[corners + 1] - self.corner_touches_indptr[corners]
+
+        land = self.is_land(self.corner_terrain[corners])
+        adjacent_land = np.bincount(
+            np.repeat(rows, adjacent_counts),
+            weights=~self.is_land(self.corner_terrain[
+                self.corner_adjacent[_row_entries(self.corner_adjacent_indptr, corners)]
+            ]),
+            minlength=len(corners),
+        ) == 0
+        touches_land = np.bincount(
+            np.repeat(rows, touches_counts),
+            weights=~self.is_land(self.center_terrain[
+                self.corner_touches[_row_entries(self.corner_touches_indptr, corners)]
+            ]),
+            minlength=len(corners),
+        ) == 0
+
+        downslope = self.corner_downslope[corners]
+        flowing = land & adjacent_land & touches_land & (downslope >= 0)
+        entries = self.corner_adjacent_indptr[corners] + np.maximum(downslope, 0)
+        flowing[flowing] &= self.is_land(self.corner_terrain[self.corner_adjacent[entries[flowing]]])
+
+        next_corners = np.where(flowing, self.corner_adjacent[np.minimum(entries, len(self.corner_adjacent) - 1)], -1)
+        next_edges = np.where(flowing, self.corner_protrudes[np.minimum(entries, len(self.corner_protrudes) - 1)], -1)
+        return next_corners, next_edges
+
+    def accumulate_flow(self, sources: np.ndarray, next_corners: np.ndarray) -> np.ndarray:
+        """
+        Sums `sources` down the river steps: the flow of a corner is its own source plus the flow of all
+        the corners whose rivers go through it.
+
+        The corners are processed in topological order of the steps (a river only goes downhill, so it's the order
+        of decreasing heights), a whole layer of corners with no unprocessed upstream corners at a time.
+        """
+        flow = np.asarray(sources, dtype=np.int64).copy()
+        flowing = next_corners >= 0
+        upstream = np.bincount(next_corners[flowing], minlength=self.n_corners)
+
+        layer = np.flatnonzero(flowing & (upstream == 0))
+        while len(layer) > 0:
+            targets = next_corners[layer]
+            np.add.at(flow, targets, flow[layer])
+            np.subtract.at(upstream, targets, 1)
+            targets = np.unique(targets)
+            layer = targets[flowing[targets] & (upstream[targets] == 0)]
+            if self.stats is not None:
+                self.stats.count('flow_layers')
+        return flow
+
+    def river_beginnings(self, min_height) -> np.ndarray:
+        """
+        Corners which can be the beginning of a river: land or coast corners at least `min_height` high
+        and corners touching a lake which are not lakes themselves.
+        """
+        return np.flatnonzero(
+            (self.is_land(self.corner_terrain) & (self.corner_height >= min_height))
+            | (self.corners_touching(TerrainType.LAKE) & (self.corner_terrain != TerrainType.LAKE.value))
+        )
+
+    def assign_corner_river(self) -> None:
+        """
+        Sets `corner_river` of the ends of every river edge. The edges are processed in order,
+        the second end gets the river of the first one if it's bigger.
+        """
+        corner_river = np.zeros(self.n_corners, dtype=np.int32)
+        river_edges = np.flatnonzero(self.edge_river > 0)
+        for v0, v1, river in zip(
+            self.edge_v0[river_edges].tolist(), self.edge_v1[river_edges].tolist(), self.edge_river[river_edges].tolist(),
+        ):
+            corner_river[v0] = max(corner_river[v0], river)
+            corner_river[v1] = max(corner_river[v0], river)
+        self.corner_river = corner_river
+
+    def create_rivers(self, n=None, min_height=0, flow_threshold=None, rng=None) -> bool:
+        """
+        Sets `edge_river` (number of rivers going through the edge) and `corner_river`.
+
+        With `n`, rivers start at `n` random river beginnings (see `river_beginnings`).
+        With `flow_threshold`, every river beginning is a source of the flow and an edge becomes a river when
+        at least `flow_threshold` sources drain through it, with `edge_river` = flow // flow_threshold.
+        Either way the rivers of the whole map are traced in a single pass (see `accumulate_flow`).
+
+        Returns False, without any rivers, when there are less than `n` river beginnings.
+        `rng` (for choosing the river beginnings) defaults to the global state `np.random`.
+        """
+        if (n is None) == (flow_threshold is None):
+            raise ValueError('Exactly one of n and flow_threshold has to be given.')
+
+        self.edge_river = np.zeros(self.n_edges, dtype=np.int32)
+        self.corner_river = np.zeros(self.n_corners, dtype=np.int32)
+        self.assign_downslopes()
+
+        beginnings = self.river_beginnings(min_height)
+        sources = np.zeros(self.n_corners, dtype=np.int64)
+        if self.stats is not None:
+            self.stats.count('river_beginnings', len(beginnings))
+        if n is not None:
+            if len(beginnings) < n:
+                heighest = self.corner_height[self.is_land(self.corner_terrain)].max()
+                logger.warning(
+                    'Found only %d river beginnings for %d rivers, lower min_height=%s '
+                    '(the highest mountain has height=%s).', len(beginnings), n, min_height, heighest,
+                )
+                return False
+            if rng is None:
+                rng = np.random
+            sources[beginnings[rng.choice(len(beginnings), n, replace=False)]] = 1
+        else:
+            sources[beginnings] = 1
+
+        next_corners, next_edges = self.river_steps()
+        flow = self.accumulate_flow(sources, next_corners)
+        river = flow if n is not None else flow // flow_threshold
+        flowing = (next_edges >= 0) & (river > 0)
+        np.add.at(self.edge_river, next_edges[flowing], river[flowing])
+        if self.stats is not None:
+            self.stats.count('river_sources', int(sources.sum()))
+            self.stats.count('river_steps', int(flowing.sum()))
+
+        self.assign_corner_river()
+        return True
+
+    def edge_lines(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        x, y and z (`corner_height`) coordinates of all the edges as a single polyline,
+        with a NaN separator after every edge: v0, v1, NaN, v0, v1, NaN, ...
+        """
+        ends = np.column_stack([self.edge_v0, self.edge_v1])
+        separators = np.full((self.n_edges, 1), np.nan)
+        return tuple(
+            np.hstack([values[ends], separators]).ravel()
+            for values in (self.corner_xy[:, 0], self.corner_xy[:, 1], self.corner_height)
+        )
+
+    def height_mesh(self, decimate: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Triangle mesh of the height map: the Delaunay triangulation of centers and corners,
+        with `center_height` and `corner_height` as z.
+        Returns the (n, 3) vertices and the (m, 3) indexes of the vertices of the triangles.
+
+        :param decimate: only every `decimate`-th center and corner is used, for a coarser (preview) mesh
+        """
+        if decimate < 1:
+            raise ValueError(f'decimate has to be a positive integer, got {decimate}.')
+        xy = np.vstack([self.center_xy[::decimate], self.corner_xy[::decimate]])
+        z = np.concatenate([self.center_height[::decimate], self.corner_height[::decimate]])
+        return np.column_stack([xy, z]), Delaunay(xy).simplices
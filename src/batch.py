@@ -0,0 +1,156 @@
+"""
+Batch generation of maps in worker processes.
+
+Usage:
+    python -m src.batch 0:1000 --out maps --N 2000 --workers 8 --chunksize 4
+"""
+from __future__ import absolute_import
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import *
+
+from src import storage
+from src.cache import StageCache
+from src.map import Graph
+from src.pipeline import Pipeline
+
+
+def generate_map(
+    seed: int,
+    N: int = 1000,
+    iterations: int = 2,
+    sampling: str = 'uniform',
+    rivers: int = 30,
+    river_min_height: float = 0.6,
+    min_water_ratio: float = 0.25,
+    distance_decay: float = 0.9,
+    river_weight: float = 0.25,
+    lake_value: float = 1.0,
+    ocean_value: float = 1.0,
+    cache: Optional[StageCache] = None,
+) -> Graph:
+    """
+    Runs the whole pipeline (see `Pipeline`): polygons, terrain, elevation, rivers, moisture and biomes.
+    :param seed: seed of the random generators (see `Graph.rng`), the same seed and parameters give the same map
+    :param rivers: number of rivers, starting at corners higher than `river_min_height`
+    :param cache: if given, the outputs of the stages are taken from it when their inputs didn't change
+    (the rest of the parameters are passed to the corresponding steps)
+    """
+    pipeline = Pipeline(
+        seed=seed,
+        cache=cache,
+        N=N,
+        iterations=iterations,
+        sampling=sampling,
+        n=rivers,
+        min_height=river_min_height,
+        min_water_ratio=min_water_ratio,
+        distance_decay=distance_decay,
+        river_weight=river_weight,
+        lake_value=lake_value,
+        ocean_value=ocean_value,
+    )
+    return pipeline.run()
+
+
+# Caches of the worker process, by their directory and budget.
+_caches = {}
+
+
+def _generate_and_save(
+    task: Tuple[int, str, Dict[str, Any], Optional[str], int, Optional[Tuple[str, int]]],
+) -> Tuple[int, str, float]:
+    """
+    Worker task: generates the map of the seed and saves it (see `storage.save`, and optionally an image)
+    in the directory. Returns the seed, the path of the map and the time it took.
+    """
+    seed, out, params, image, resolution, cache = task
+    start = time.perf_counter()
+    if cache is not None:
+        if cache not in _caches:
+            directory, disk_bytes = cache
+            _caches[cache] = StageCache(directory=directory, disk_bytes=disk_bytes)
+        cache = _caches[cache]
+    graph = generate_map(seed, cache=cache, **params)
+    path = os.path.join(out, f'map_{seed}')
+    storage.save(graph, path, metadata=dict(seed=seed, **params))
+    if image is not None:
+        graph.render(image, resolution, os.path.join(out, f'map_{seed}.png'))
+    return seed, path, time.perf_counter() - start
+
+
+def parse_seeds(values: List[str]) -> List[int]:
+    """
+    Seeds given as numbers or as ranges 'start:stop' (without stop, as in `range`).
+    """
+    seeds = []
+    for value in values:
+        if ':' in value:
+            start, stop = value.split(':')
+            seeds.extend(range(int(start), int(stop)))
+        else:
+            seeds.append(int(value))
+    return seeds
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Generates maps for a list of seeds in worker processes.')
+    parser.add_argument('seeds', nargs='+', help="seeds, as numbers or ranges 'start:stop'")
+    parser.add_argument('--out', default='maps', help='output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--chunksize', type=int, default=1, help='number of maps sent to a worker at once')
+    parser.add_argument('--N', type=int, default=1000, help='number of polygons')
+    parser.add_argument('--iterations', type=int, default=2, help='iterations of the relaxation')
+    parser.add_argument(
+        '--sampling', choices=('uniform', 'poisson'), default='uniform',
+        help="points of the polygons, 'poisson' needs at most one iteration of the relaxation",
+    )
+    parser.add_argument('--rivers', type=int, default=30, help='number of rivers')
+    parser.add_argument('--river-min-height', type=float, default=0.6, help='minimal height of a river beginning')
+    parser.add_argument('--min-water-ratio', type=float, default=0.25)
+    parser.add_argument('--distance-decay', type=float, default=0.9)
+    parser.add_argument('--river-weight', type=float, default=0.25)
+    parser.add_argument('--lake-value', type=float, default=1.0)
+    parser.add_argument('--ocean-value', type=float, default=1.0)
+    parser.add_argument(
+        '--image', choices=('terrain', 'height', 'moisture', 'biome'), default=None,
+        help='also save an image of the map with this layer',
+    )
+    parser.add_argument('--resolution', type=int, default=1024, help='size of the images')
+    parser.add_argument('--cache', default=None, help='directory of the cache of the stages (see StageCache)')
+    parser.add_argument('--cache-bytes', type=int, default=2 ** 30, help='budget of the cache on disk, in bytes')
+    args = parser.parse_args(argv)
+
+    if args.workers < 1:
+        parser.error('--workers has to be positive')
+    seeds = parse_seeds(args.seeds)
+    params = dict(
+        N=args.N,
+        iterations=args.iterations,
+        sampling=args.sampling,
+        rivers=args.rivers,
+        river_min_height=args.river_min_height,
+        min_water_ratio=args.min_water_ratio,
+        distance_decay=args.distance_decay,
+        river_weight=args.river_weight,
+        lake_value=args.lake_value,
+        ocean_value=args.ocean_value,
+    )
+    os.makedirs(args.out, exist_ok=True)
+    cache = (args.cache, args.cache_bytes) if args.cache is not None else None
+    tasks = [(seed, args.out, params, args.image, args.resolution, cache) for seed in seeds]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for done, (seed, path, seconds) in enumerate(
+            executor.map(_generate_and_save, tasks, chunksize=args.chunksize), 1,
+        ):
+            print(f'[{done}/{len(tasks)}] seed={seed} {path} ({seconds:.2f}s)')
+    elapsed = time.perf_counter() - start
+    print(f'Generated {len(tasks)} maps in {elapsed:.1f}s ({len(tasks) / elapsed:.2f} maps/sec, {args.workers} workers)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Content-addressed cache of the outputs of the pipeline stages.
+
+The output of a stage (a dict of arrays, e.g. the columns it sets) is stored under the key of the stage:
+a hash of the stage name, its parameters, the keys of the stages it depends on and the seed. Changing
+a parameter of a stage changes its key and the keys of all the stages after it, while the stages before
+it are taken from the cache.
+"""
+from __future__ import absolute_import
+import hashlib
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+import numpy as np
+from typing import *
+
+# Part of every key, to be increased whenever the outputs of the stages change for the same inputs.
+CACHE_VERSION = 1
+
+
+def stage_key(stage: str, params: Dict[str, Any], upstream: Sequence[str] = (), seed: Optional[int] = None) -> str:
+    """
+    Key of the output of the stage run with `params` on the outputs of the stages with the keys `upstream`.
+    The seed is required: without one the output depends on the global state of `np.random`.
+    """
+    if seed is None:
+        raise ValueError(f'The output of the {stage} stage can be cached only with a seed.')
+    content = json.dumps(
+        {'version': CACHE_VERSION, 'stage': stage, 'params': params, 'upstream': list(upstream), 'seed': seed},
+        sort_keys=True,
+        default=repr,
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _nbytes(arrays: Dict[str, np.ndarray]) -> int:
+    return sum(array.nbytes for array in arrays.values())
+
+
+class StageCache:
+    """
+    Cache of the outputs of stages in memory and, with `directory`, on disk (a directory of `.npy` files per key).
+    Both of them keep their total size within a budget in bytes, evicting the least recently used outputs.
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int = 256 * 2 ** 20,
+        directory: Optional[str] = None,
+        disk_bytes: int = 2 ** 30,
+    ):
+        """
+        :param memory_bytes: budget of the in-memory cache
+        :param directory: directory of the on-disk cache, without it only the memory is used
+        :param disk_bytes: budget of the on-disk cache
+        """
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        # key -> size on disk, from the least to the most recently used
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            entries = []
+            for key in os.listdir(directory):
+                path = os.path.join(directory, key)
+                if os.path.isdir(path) and not key.startswith('.'):
+                    files = [os.path.join(path, name) for name in os.listdir(path)]
+                    entries.append((os.path.getmtime(path), key, sum(os.path.getsize(f) for f in files)))
+            for _, key, size in sorted(entries):
+                self._disk[key] = size
+                self._disk_size += size
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._memory or key in self._disk
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        The output stored under the key, or None.
+        """
+        arrays = self._memory.get(key)
+        if arrays is not None:
+            self._memory.move_to_end(key)
+        elif key in self._disk:
+            path = os.path.join(self.directory, key)
+            try:
+                arrays = {
+                    name[:-len('.npy')]: np.load(os.path.join(path, name), allow_pickle=False)
+                    for name in os.listdir(path)
+                }
+                now = time.time()
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                # Evicted by another process sharing the directory.
+                self._disk_size -= self._disk.pop(key)
+            else:
+                self._disk.move_to_end(key)
+                self._remember(key, arrays)
+
+        if arrays is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        """
+        Stores the output under the key (a copy of the arrays, so they can be changed later).
+        """
+        arrays = {name: np.array(array) for name, array in arrays.items()}
+        self._remember(key, arrays)
+        if self.directory is not None and key not in self._disk:
+            self._write(key, arrays)
+
+    def _remember(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        size = _nbytes(arrays)
+        if size > self.memory_bytes:
+            return
+        self._memory[key] = arrays
+        self._memory_size += size
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= _nbytes(evicted)
+
+    def _write(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        size = _nbytes(arrays)
+        if size > self.disk_bytes:
+            return
+        # Written next to the final directory and renamed, so a key is either complete or missing.
+        temporary = os.path.join(self.directory, f'.{key}.{os.getpid()}')
+        os.makedirs(temporary, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f'{name}.npy'), array, allow_pickle=False)
+        size = sum(os.path.getsize(os.path.join(temporary, f'{name}.npy')) for name in arrays)
+        try:
+            os.rename(temporary, os.path.join(self.directory, key))
+        except OSError:
+            # Another process has just written the same key (or the directory can't be written at all).
+            shutil.rmtree(temporary, ignore_errors=True)
+            if not os.path.isdir(os.path.join(self.directory, key)):
+                return
+        if key in self._disk:
+            self._disk_size -= self._disk.pop(key)
+        self._disk[key] = size
+        self._disk_size += size
+        while self._disk_size > self.disk_bytes:
+            evicted, evicted_size = self._disk.popitem(last=False)
+            self._disk_size -= evicted_size
+            shutil.rmtree(os.path.join(self.directory, evicted), ignore_errors=True)
+
+    def clear(self) -> None:
+        self._memory.clear()
+        self._memory_size = 0
+        for key in self._disk:
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+        self._disk.clear()
+        self._disk_size = 0
+
+    def run(self, graph, key: str, columns: Sequence[str], compute: Callable[[], Any]) -> bool:
+        """
+        Sets the columns of `graph` (and its objects) from the cache, or computes them with `compute`
+        and stores them under the key. Returns whether the columns came from the cache.
+        """
+        cached = self.get(key)
+        if cached is None:
+            compute()
+            graph.arrays.pull(graph, *columns)
+            self.put(key, {name: getattr(graph.arrays, name) for name in columns})
+            return False
+        for name in columns:
+            setattr(graph.arrays, name, cached[name].copy())
+        graph.arrays.push(graph, *columns)
+        return True
@@ -0,0 +1,221 @@
+"""
+Streaming export of maps as GeoJSON features: the polygons of the cells, the rivers and the coastline.
+
+The features are made by generators, a chunk of cells or edges at a time, and written one per line
+(NDJSON, or GeoJSON text sequences with `format='geojsonseq'`), so exporting a map saved with `storage.save`
+never holds more than a chunk of it in memory.
+
+Usage:
+    python -m src.export maps/map_0 map_0.ndjson [--layers cells rivers coastline] [--format ndjson] [--precision 6]
+"""
+from __future__ import absolute_import
+import argparse
+import itertools
+import json
+import numpy as np
+from typing import *
+
+from src.arrays import ArrayGraph
+from src.terrain import TerrainType, BiomeType
+
+LAYERS = ('cells', 'rivers', 'coastline')
+FORMATS = ('ndjson', 'geojsonseq')
+# Number of cells (or edges) converted to Python objects at once.
+CHUNK = 4096
+
+# GeoJSON text sequences (RFC 8142) start every feature with the record separator.
+_RECORD_SEPARATOR = '\x1e'
+
+
+def _names(enum) -> Dict[int, str]:
+    return {member.value: member.name.lower() for member in enum}
+
+
+def _round(xy: np.ndarray, precision: Optional[int]) -> np.ndarray:
+    return xy if precision is None else np.round(xy, precision)
+
+
+def cell_features(arrays: ArrayGraph, precision: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Polygon of every cell, with its terrain, biome, height and moisture as properties.
+    The rings are closed and counterclockwise, as in RFC 7946.
+    :param precision: if given, the coordinates are rounded to this many decimal places
+    """
+    terrain_names, biome_names = _names(TerrainType), _names(BiomeType)
+    indptr = arrays.polygon_indptr
+    for start in range(0, arrays.n_centers, CHUNK):
+        stop = min(start + CHUNK, arrays.n_centers)
+        offsets = np.asarray(indptr[start:stop + 1] - indptr[start])
+        xy = np.asarray(arrays.polygon_xy[indptr[start]:indptr[stop]])
+
+        # Twice the signed area of every polygon (shoelace formula), negative for the clockwise ones.
+        following = np.arange(1, len(xy) + 1)
+        following[offsets[1:] - 1] = offsets[:-1]
+        cross = xy[:, 0] * xy[following, 1] - xy[following, 0] * xy[:, 1]
+        clockwise = (np.add.reduceat(cross, offsets[:-1]) < 0).tolist()
+
+        coordinates = _round(xy, precision).tolist()
+        terrain = arrays.center_terrain[start:stop].tolist()
+        biome = arrays.center_biome[start:stop].tolist()
+        height = arrays.center_height[start:stop].tolist()
+        moisture = arrays.center_moisture[start:stop].tolist()
+        offsets = offsets.tolist()
+        for k in range(stop - start):
+            ring = coordinates[offsets[k]:offsets[k + 1]]
+            if clockwise[k]:
+                ring.reverse()
+            ring.append(ring[0])
+            yield {
+                'type': 'Feature',
+                'id': start + k,
+                'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+                'properties': {
+                    'layer': 'cell',
+                    'terrain': terrain_names[terrain[k]],
+                    'biome': biome_names[biome[k]],
+                    'height': height[k],
+                    'moisture': moisture[k],
+                },
+            }
+
+
+def river_features(arrays: ArrayGraph, precision: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Rivers as polylines going downstream, with `river` (the number of rivers going through it, see
+    `ArrayGraph.create_rivers`) as a property. A polyline ends where its river joins another one
+    or its `river` changes, so the whole polyline has the same `river`.
+
+    Only the corners of the river edges (found a chunk of edges at a time) are traced, so the memory
+    depends on the length of the rivers and not on the size of the map.
+    """
+    edges = np.concatenate([np.zeros(0, dtype=np.int64)] + [
+        np.flatnonzero(np.asarray(arrays.edge_river[start:start + CHUNK]) > 0) + start
+        for start in range(0, arrays.n_edges, CHUNK)
+    ])
+    # The corners of the rivers, sorted, the rest of the arrays are indexed by the positions in `corners`.
+    corners = np.unique(np.concatenate([arrays.edge_v0[edges], arrays.edge_v1[edges]]))
+    next_corners, next_edges = arrays.river_steps(corners)
+    flowing = next_edges >= 0
+    flowing[flowing] &= arrays.edge_river[next_edges[flowing]] > 0
+    local = np.flatnonzero(flowing)
+    # Downstream of a river corner is the other end of a river edge, so it's one of `corners` too.
+    downstream = np.full(len(corners), -1, dtype=np.int64)
+    downstream[local] = np.searchsorted(corners, next_corners[local])
+    river = np.zeros(len(corners), dtype=np.int64)
+    river[local] = arrays.edge_river[next_edges[local]]
+
+    # A polyline starts in every corner which is not the continuation of a single river with the same value.
+    upstream = np.bincount(downstream[local], minlength=len(corners))
+    continued = np.zeros(len(corners), dtype=bool)
+    single = local[upstream[downstream[local]] == 1]
+    continued[downstream[single]] = river[downstream[single]] == river[single]
+    starts = local[~continued[local]]
+
+    downstream_list, river_list, continued_list = downstream.tolist(), river.tolist(), continued.tolist()
+    for i, start in enumerate(starts.tolist()):
+        line = [start]
+        corner = downstream_list[start]
+        line.append(corner)
+        while corner >= 0 and downstream_list[corner] >= 0 and continued_list[corner]:
+            corner = downstream_list[corner]
+            line.append(corner)
+        yield {
+            'type': 'Feature',
+            'id': i,
+            'geometry': {'type': 'LineString', 'coordinates': _round(arrays.corner_xy[corners[line]], precision).tolist()},
+            'properties': {'layer': 'river', 'river': river_list[start]},
+        }
+
+
+def coastline_features(arrays: ArrayGraph, precision: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Every edge between an ocean cell and a land (or coast) cell, as a line from `edge_v0` to `edge_v1`.
+    The edges are found a chunk at a time.
+    """
+    for start in range(0, arrays.n_edges, CHUNK):
+        chunk = arrays.coastline_edges(start, start + CHUNK)
+        lines = _round(
+            np.stack([arrays.corner_xy[arrays.edge_v0[chunk]], arrays.corner_xy[arrays.edge_v1[chunk]]], axis=1),
+            precision,
+        ).reshape(-1, 2, 2).tolist()
+        for edge, line in zip(chunk.tolist(), lines):
+            yield {
+                'type': 'Feature',
+                'id': edge,
+                'geometry': {'type': 'LineString', 'coordinates': line},
+                'properties': {'layer': 'coastline'},
+            }
+
+
+_LAYER_FEATURES = {'cells': cell_features, 'rivers': river_features, 'coastline': coastline_features}
+
+
+def features(
+    arrays: ArrayGraph,
+    layers: Sequence[str] = LAYERS,
+    precision: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Features of all the layers ('cells', 'rivers' and 'coastline'), one layer after another.
+    """
+    for layer in layers:
+        if layer not in _LAYER_FEATURES:
+            raise ValueError(f'Unexpected layer: {layer}')
+    return itertools.chain.from_iterable(_LAYER_FEATURES[layer](arrays, precision) for layer in layers)
+
+
+def write_features(features: Iterable[Dict[str, Any]], path: str, format: str = 'ndjson') -> int:
+    """
+    Writes the features to the file one at a time, as NDJSON or GeoJSON text sequences ('geojsonseq').
+    Returns the number of written features.
+    """
+    if format not in FORMATS:
+        raise ValueError(f'Unexpected format: {format}')
+    prefix = _RECORD_SEPARATOR if format == 'geojsonseq' else ''
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    count = 0
+    with open(path, 'w') as f:
+        for feature in features:
+            f.write(f'{prefix}{encode(feature)}\n')
+            count += 1
+    return count
+
+
+def export(
+    graph,
+    path: str,
+    layers: Sequence[str] = LAYERS,
+    format: str = 'ndjson',
+    precision: Optional[int] = None,
+) -> int:
+    """
+    Writes the layers of a `Graph` or an `ArrayGraph` to the file (see `features` and `write_features`).
+    Returns the number of written features.
+    """
+    if isinstance(graph, ArrayGraph):
+        arrays = graph
+    else:
+        arrays = graph.arrays
+        arrays.pull(graph)
+    return write_features(features(arrays, layers, precision), path, format)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # Imported here, the exporters themselves work on any ArrayGraph.
+    from src import storage
+
+    parser = argparse.ArgumentParser(description='Export a saved map as GeoJSON features.')
+    parser.add_argument('map', help='directory of a map saved with storage.save')
+    parser.add_argument('out', help='output file')
+    parser.add_argument('--layers', nargs='+', default=list(LAYERS), choices=LAYERS)
+    parser.add_argument('--format', default='ndjson', choices=FORMATS)
+    parser.add_argument('--precision', type=int, default=None, help='decimal places of the coordinates')
+    args = parser.parse_args(argv)
+
+    count = export(storage.load(args.map).arrays, args.out, args.layers, args.format, args.precision)
+    print(f'{count} features written to {args.out}')
+    return count
+
+
+if __name__ == '__main__':
+    main()
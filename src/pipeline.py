@@ -0,0 +1,179 @@
+"""
+Map generation as a pipeline of stages which recomputes only the stages affected by a change of parameters.
+"""
+from __future__ import absolute_import
+from collections import OrderedDict
+from typing import *
+
+from src.arrays import ArrayGraph
+from src.cache import StageCache, stage_key
+from src.map import Graph
+from src.stats import GenerationStats
+from src.terrain import (
+    assign_terrain_types_to_graph,
+    BIOME_TABLE,
+    MIN_WATER_EDGES_RATIO_TO_BE_WATER_CENTER,
+    CHANCE_OF_WATER_EDGE_IN_MIDDLE,
+    OCEAN_TO_TOTAL_RATIO,
+    LAKE_TO_TOTAL_RATIO,
+)
+
+
+class Stage:
+    """
+    A step of the pipeline: `run(graph, **params)` sets the `columns` of the graph from the columns
+    set by the stages it `depends_on`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        depends_on: Tuple[str, ...],
+        columns: Tuple[str, ...],
+        defaults: Dict[str, Any],
+        run: Callable[..., Any],
+    ):
+        self.name = name
+        self.depends_on = depends_on
+        self.columns = columns
+        self.defaults = defaults
+        self.run = run
+
+
+def _elevation(graph: Graph, scale_factor: float) -> None:
+    graph.assign_corner_elevations()
+    graph.redistribute_elevations(scale_factor=scale_factor)
+    graph.assign_center_elevations()
+
+
+# The stages in the order they are run, the polygons (the graph itself) are made by `Pipeline.run`.
+STAGES = OrderedDict((stage.name, stage) for stage in (
+    Stage('polygons', (), (), dict(N=1000, iterations=2, sampling='uniform'), None),
+    Stage(
+        'terrain', ('polygons',), ('center_terrain', 'corner_terrain'),
+        dict(
+            min_water_ratio=MIN_WATER_EDGES_RATIO_TO_BE_WATER_CENTER,
+            chance_of_water_edge_in_middle=CHANCE_OF_WATER_EDGE_IN_MIDDLE,
+            ocean_to_total_ratio=OCEAN_TO_TOTAL_RATIO,
+            lake_to_total_ratio=LAKE_TO_TOTAL_RATIO,
+        ),
+        assign_terrain_types_to_graph,
+    ),
+    Stage('elevation', ('terrain',), ('corner_height', 'center_height'), dict(scale_factor=1.1), _elevation),
+    Stage(
+        'rivers', ('terrain', 'elevation'), ('corner_downslope', 'edge_river', 'corner_river'),
+        dict(n=30, min_height=0.6, flow_threshold=None),
+        Graph.create_rivers,
+    ),
+    Stage(
+        'moisture', ('terrain', 'rivers'), ('corner_moisture', 'center_moisture'),
+        dict(redistribute=True, distance_decay=0.9, river_weight=0.25, lake_value=1.0, ocean_value=1.0),
+        Graph.assign_moisture,
+    ),
+    Stage('biomes', ('terrain', 'elevation', 'moisture'), ('center_biome',), dict(table=BIOME_TABLE),
+          Graph.assign_biomes),
+))
+
+
+class Pipeline:
+    """
+    Generates a map and keeps it up to date with its parameters: `set` marks the stage whose parameters
+    changed and all the stages depending on it as dirty, and `run` recomputes only the dirty stages.
+
+        pipeline = Pipeline(seed=1, N=20000)
+        graph = pipeline.run()
+        pipeline.set('moisture', distance_decay=0.8)
+        graph = pipeline.run()  # only moisture and biomes are recomputed
+    """
+
+    def __init__(
+        self,
+        seed: Optional[int] = None,
+        cache: Optional[StageCache] = None,
+        stats: Optional[GenerationStats] = None,
+        **params
+    ):
+        """
+        :param seed: seed of the map (see `Graph.rng`)
+        :param cache: if given, the outputs of the stages are also taken from and stored in it, needs a seed
+            (without one the stages draw from the global state of `np.random` and their outputs can't be reused)
+        :param stats: if given, the stages computed by `run` are recorded in it (the ones taken from the cache are not)
+        :param params: parameters of the stages by name, e.g. `N=2000, distance_decay=0.8`
+        """
+        if cache is not None and seed is None:
+            raise ValueError('A cache needs a seed, the outputs of the stages are random without one.')
+        self.seed = seed
+        self.cache = cache
+        self.stats = stats
+        self.params = OrderedDict((name, dict(stage.defaults)) for name, stage in STAGES.items())
+        self.graph = None
+        self.keys = {}
+        self.dirty = set(STAGES)
+        for name, value in params.items():
+            stages = [stage for stage, stage_params in self.params.items() if name in stage_params]
+            if not stages:
+                raise ValueError(f'Unexpected parameter: {name}')
+            self.params[stages[0]][name] = value
+
+    def dependents(self, stage: str) -> List[str]:
+        """
+        The stage and all the stages depending on it (directly or not), in the order of the pipeline.
+        """
+        affected = {stage}
+        for name, other in STAGES.items():
+            if any(dependency in affected for dependency in other.depends_on):
+                affected.add(name)
+        return [name for name in STAGES if name in affected]
+
+    def set(self, stage: str, **params) -> List[str]:
+        """
+        Changes parameters of the stage. Returns the stages which became dirty (none when nothing changed).
+        """
+        if stage not in STAGES:
+            raise ValueError(f'Unexpected stage: {stage}')
+        for name in params:
+            if name not in self.params[stage]:
+                raise ValueError(f'Unexpected parameter of the {stage} stage: {name}')
+        if all(self.params[stage][name] == value for name, value in params.items()):
+            return []
+        self.params[stage].update(params)
+        affected = self.dependents(stage)
+        self.dirty.update(affected)
+        return affected
+
+    def _key(self, stage: str) -> str:
+        upstream = [self.keys[dependency] for dependency in STAGES[stage].depends_on]
+        return stage_key(stage, self.params[stage], upstream, self.seed)
+
+    def run(self) -> Graph:
+        """
+        Recomputes the dirty stages and returns the graph.
+        """
+        for name, stage in STAGES.items():
+            if name not in self.dirty:
+                continue
+            if self.cache is not None:
+                self.keys[name] = self._key(name)
+            if name == 'polygons':
+                self._make_graph()
+            elif self.cache is not None:
+                self.cache.run(self.graph, self.keys[name], stage.columns,
+                               lambda: stage.run(self.graph, **self.params[name]))
+            else:
+                stage.run(self.graph, **self.params[name])
+            self.dirty.discard(name)
+        return self.graph
+
+    def _make_graph(self) -> None:
+        params = self.params['polygons']
+        arrays = self.cache.get(self.keys['polygons']) if self.cache is not None else None
+        if arrays is None:
+            self.graph = Graph(
+                N=params['N'], iterations=params['iterations'], sampling=params['sampling'],
+                seed=self.seed, stats=self.stats,
+            )
+            if self.cache is not None:
+                self.cache.put(self.keys['polygons'], self.graph.arrays.to_dict())
+        else:
+            self.graph = Graph.from_arrays(ArrayGraph(**arrays), seed=self.seed)
+            self.graph.stats = self.stats
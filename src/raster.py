@@ -0,0 +1,185 @@
+from __future__ import absolute_import
+import struct
+import zlib
+import numpy as np
+from typing import *
+
+from src.arrays import ArrayGraph
+from src.terrain import TerrainType, BiomeType
+
+
+LAYERS = ('terrain', 'height', 'moisture', 'biome')
+
+BACKGROUND_COLOR = (128, 128, 128)
+
+# ColorBrewer scales used by matplotlib's 'Greens' and 'YlGn' colormaps.
+GREENS = np.array([
+    (247, 252, 245), (229, 245, 224), (199, 233, 192), (161, 217, 155), (116, 196, 118),
+    (65, 171, 93), (35, 139, 69), (0, 109, 44), (0, 68, 27),
+])
+YLGN = np.array([
+    (255, 255, 229), (247, 252, 185), (217, 240, 163), (173, 221, 142), (120, 198, 121),
+    (65, 171, 93), (35, 132, 67), (0, 104, 55), (0, 69, 41),
+])
+
+TERRAIN_COLORS = {
+    TerrainType.OCEAN: (0, 191, 255),  # deepskyblue
+    TerrainType.COAST: (240, 230, 140),  # khaki
+    TerrainType.LAKE: (65, 105, 225),  # royalblue
+}
+
+BIOME_COLORS = {
+    BiomeType.OCEAN: (0, 191, 255),  # deepskyblue
+    BiomeType.LAKE: (65, 105, 225),  # royalblue
+    BiomeType.COAST: (240, 230, 140),  # khaki
+    BiomeType.SNOW: (248, 248, 248),
+    BiomeType.TUNDRA: (227, 228, 224),
+    BiomeType.BARE: (200, 198, 195),
+    BiomeType.SCORCHED: (123, 123, 123),
+    BiomeType.TAIGA: (188, 214, 144),
+    BiomeType.SHRUBLAND: (211, 224, 150),
+    BiomeType.TEMPERATE_DESERT: (208, 203, 165),
+    BiomeType.TEMPERATE_RAIN_FOREST: (55, 111, 44),
+    BiomeType.TEMPERATE_DECIDOUS_FOREST: (123, 164, 91),
+    BiomeType.GRASSLAND: (160, 195, 121),
+    BiomeType.TROPICAL_RAIN_FOREST: (32, 78, 23),
+    BiomeType.TROPICAL_SEASONAL_FOREST: (91, 124, 64),
+    BiomeType.SUBTROPICAL_DESERT: (230, 225, 168),
+    BiomeType.MARSH: (148, 217, 200),
+    BiomeType.ICE: (224, 255, 255),  # lightcyan
+    BiomeType.DEEPOCEAN: (30, 144, 255),  # dodgerblue
+}
+
+
+def rasterize(polygon_xy: np.ndarray, polygon_indptr: np.ndarray, resolution: Union[int, Tuple[int, int]]) -> np.ndarray:
+    """
+    Scan-converts convex polygons tiling [0, 1]^2 into an image of polygon indexes (-1 where there is no polygon).
+
+    :param polygon_xy: vertices of all the polygons, one polygon after another
+    :param polygon_indptr: the vertices of the i-th polygon are polygon_xy[polygon_indptr[i]:polygon_indptr[i + 1]]
+    :param resolution: width and height of the image, or a single size for a square image
+
+    The first row of the image is the top (y = 1) of the map. A pixel belongs to the polygon containing its center.
+    As the polygons tile the map, every row is split into consecutive runs of pixels of a single polygon, so only
+    the first pixel of every run is computed (from the left borders of the polygons) and the runs are filled
+    with a single forward fill over the whole image.
+    """
+    width, height = (resolution, resolution) if np.isscalar(resolution) else resolution
+    counts = np.diff(polygon_indptr)
+    polygon_ids = np.repeat(np.arange(len(counts)), counts)
+
+    # Pixel coordinates, the center of the pixel (row, col) is at (col, row).
+    xs = polygon_xy[:, 0] * width - 0.5
+    ys = (1 - polygon_xy[:, 1]) * height - 0.5
+    following = np.arange(1, len(xs) + 1)
+    following[polygon_indptr[1:] - 1] = polygon_indptr[:-1]
+    x0, y0, x1, y1 = xs, ys, xs[following], ys[following]
+
+    # A side of a convex polygon is on its left border when the inside of the polygon (e.g. the mean of its
+    # vertices) is on the right (+x) side of the line through the side.
+    center_x = (np.bincount(polygon_ids, weights=xs) / counts)[polygon_ids]
+    center_y = (np.bincount(polygon_ids, weights=ys) / counts)[polygon_ids]
+    dx, dy = x1 - x0, y1 - y0
+    left = (dy * (center_x - x0) - dx * (center_y - y0)) * dy > 0
+    x0, y0, y1, side_polygons = x0[left], y0[left], y1[left], polygon_ids[left]
+    slopes = dx[left] / dy[left]
+
+    # Rows of pixel centers crossed by every side, without the last one, so every row crosses a single left side.
+    first_rows = np.clip(np.ceil(np.minimum(y0, y1)), 0, height).astype(np.int64)
+    end_rows = np.clip(np.ceil(np.maximum(y0, y1)), 0, height).astype(np.int64)
+    row_counts = end_rows - first_rows
+    sides = np.repeat(np.arange(len(first_rows)), row_counts)
+    rows = np.repeat(first_rows - np.cumsum(row_counts) + row_counts, row_counts) + np.arange(row_counts.sum())
+    xs = x0[sides] + (rows - y0[sides]) * slopes[sides]
+    cols = np.clip(np.ceil(xs), 0, width).astype(np.int64)
+    inside = cols < width
+    xs, sides, pixels = xs[inside], sides[inside], rows[inside] * width + cols[inside]
+
+    # A polygon narrower than a pixel in some row starts in the same pixel as the next one, which covers it.
+    # Pixels are sorted by (pixel, x) with a single key: x - cols + 1 is in (0, 1], so only the last one is kept.
+    order = np.argsort(2.0 * pixels + np.clip(xs - cols[inside] + 1, 0, 1))
+    pixels = pixels[order]
+    last = np.append(pixels[1:] != pixels[:-1], True)
+
+    starts = np.full(width * height, -1, dtype=np.int32)
+    starts[pixels[last]] = side_polygons[sides[order[last]]]
+
+    run_starts = np.where(starts >= 0, np.arange(width * height, dtype=np.int32), 0)
+    np.maximum.accumulate(run_starts, out=run_starts)
+    return starts[run_starts].reshape(height, width)
+
+
+def _scale_colors(scale: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    Colors of the values in [0, 1] on a linear color scale (values outside are clipped).
+    """
+    positions = np.linspace(0, 1, len(scale))
+    values = np.clip(np.nan_to_num(values), 0, 1)
+    return np.column_stack([np.interp(values, positions, scale[:, channel]) for channel in range(3)])
+
+
+def layer_colors(arrays: ArrayGraph, layer: str = 'terrain') -> np.ndarray:
+    """
+    RGB color of every center in the given layer ('terrain', 'height', 'moisture' or 'biome'),
+    the same as in `Graph.plot_full_map`.
+    """
+    terrain = arrays.center_terrain
+    colors = np.zeros((arrays.n_centers, 3))
+    if layer == 'biome':
+        palette = np.zeros((max(biome.value for biome in BiomeType) + 1, 3))
+        for biome, color in BIOME_COLORS.items():
+            palette[biome.value] = color
+        colors = palette[arrays.center_biome]
+    elif layer in ('terrain', 'height', 'moisture'):
+        for terrain_type, color in TERRAIN_COLORS.items():
+            colors[terrain == terrain_type.value] = color
+        scaled = terrain == TerrainType.LAND.value
+        if layer != 'terrain':
+            scaled |= terrain == TerrainType.COAST.value
+        if layer == 'moisture':
+            colors[scaled] = _scale_colors(YLGN, arrays.center_moisture[scaled])
+        else:
+            colors[scaled] = _scale_colors(GREENS, 1.0 - arrays.center_height[scaled])
+    else:
+        raise AttributeError(f'Unexpected plot type: {layer}')
+    return np.round(colors).astype(np.uint8)
+
+
+def render(arrays: ArrayGraph, layer: str = 'terrain', resolution: Union[int, Tuple[int, int]] = 1024) -> np.ndarray:
+    """
+    Renders the layer of the map as an RGB image (height x width x 3, uint8).
+    """
+    labels = rasterize(arrays.polygon_xy, arrays.polygon_indptr, resolution)
+    palette = np.vstack([layer_colors(arrays, layer), np.array([BACKGROUND_COLOR], dtype=np.uint8)])
+    # Pixels outside of every polygon have the label -1, which is the background at the end of the palette.
+    return palette[labels]
+
+
+def write_png(path: str, image: np.ndarray) -> None:
+    """
+    Writes an RGB (height x width x 3) or grayscale (height x width) uint8 image as a PNG file.
+    """
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape[:2]
+    color_type = 2 if image.ndim == 3 else 0
+    # Every row starts with the filter type, 0 (none).
+    rows = np.hstack([np.zeros((height, 1), dtype=np.uint8), image.reshape(height, -1)])
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 1)))
+        f.write(chunk(b'IEND', b''))
+
+
+def save_image(path: str, image: np.ndarray) -> None:
+    """
+    Saves the image as a PNG file, or as a raw NumPy array when the path ends with '.npy'.
+    """
+    if path.endswith('.npy'):
+        np.save(path, image)
+    else:
+        write_png(path, image)
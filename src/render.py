@@ -0,0 +1,299 @@
+"""
+Plotting of the maps with matplotlib and plotly. It's imported only by the `plot_*` methods, so the generation
+of the maps doesn't need the plotting libraries (see `Graph.render` for images without them).
+"""
+from __future__ import absolute_import
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.patches import Polygon
+from matplotlib.collections import PatchCollection
+from scipy.spatial import ConvexHull
+import plotly.graph_objs as go
+
+from src.terrain import TerrainType, BiomeType
+
+
+def plot_map(graph):
+    plt.figure(figsize=(10,10))
+    plt.rcParams['axes.facecolor'] = 'grey'
+
+    plt.scatter(
+        [center.x for center in graph.centers],
+        [center.y for center in graph.centers], c='red')
+    plt.scatter(
+        [corner.x for corner in graph.corners],
+        [corner.y for corner in graph.corners], c='blue')
+    for edge in graph.edges:
+        plt.plot([edge.v0.x, edge.v1.x], [edge.v0.y, edge.v1.y], c='white')
+        plt.plot([edge.d0.x, edge.d1.x], [edge.d0.y, edge.d1.y], c='black')
+
+    plt.xlim(0,1)
+    plt.ylim(0,1)
+    plt.show()
+
+
+def plot_full_map(
+    graph,
+    plot_type='terrain',
+    debug_height=False,
+    debug_moisture=False,
+    downslope_arrows=False,
+    rivers=True,
+):
+    """
+    Here the next adjustments will be added to create a complete map.
+    """
+    fig, ax = plt.subplots(figsize=(10, 10))
+
+    polygons = [_center_to_polygon(center, plot_type) for center in graph.centers]
+    p = PatchCollection(polygons, match_original=True)
+    ax.add_collection(p)
+
+    # PLOT HEIGHT LABELS
+    if debug_height:
+        for corner in graph.corners:
+            plt.annotate(
+                f"{round(corner.height, 1)}", (corner.x, corner.y), 
+                color='white', backgroundcolor='black'
+            )
+
+    # PLOT MOISTURE LABELS
+    if debug_moisture:
+        for center in graph.centers:
+            plt.annotate(
+                f"{round(center.moisture, 1)}", (center.x, center.y), 
+                color='white', backgroundcolor='black'
+            )
+
+    def drawArrow(A, B, color='darkblue'):
+        plt.arrow(
+            A[0], A[1], B[0] - A[0], B[1] - A[1],
+            head_width=0.015, length_includes_head=True, color=color
+        )
+
+    # PLOT DOWNSLOPE ARROWS
+    if downslope_arrows:
+        for corner in graph.corners:
+            if corner.downslope is not None:
+                adjacent = corner.adjacent[corner.downslope]
+                drawArrow(A=corner.get_cords(), B=adjacent.get_cords())
+
+    # PLOT RIVERS
+    if rivers:
+        for edge in graph.edges:
+            if edge.river > 0:
+                beg_x, beg_y = edge.v0.get_cords()
+                end_x, end_y = edge.v1.get_cords()
+                X = (beg_x, end_x)
+                Y = (beg_y, end_y)
+                plt.plot(X, Y, linewidth=2+2*np.sqrt(edge.river), color='blue')
+
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    plt.show()
+
+
+def plot_3d_height_map(graph, mode='wireframe', decimate=1, show=True):
+    """
+    Function for plotting terrain height (based on the height of the corners and centers) with plotly.
+    :param mode: 'wireframe' draws all the edges as a single line trace,
+        'mesh' draws a shaded surface (see `ArrayGraph.height_mesh`)
+    :param decimate: for 'mesh', only every `decimate`-th center and corner is used (a faster preview)
+    :param show: whether to show the figure, it's returned either way
+    """
+    graph.arrays.pull(graph, 'center_height', 'corner_height')
+    if mode == 'wireframe':
+        xs, ys, zs = graph.arrays.edge_lines()
+        traces = [go.Scatter3d(
+            x=xs, y=ys, z=zs,
+            mode='lines',
+            line=dict(color='#0066FF', width=2),
+            connectgaps=False,
+        )]
+    elif mode == 'mesh':
+        vertices, triangles = graph.arrays.height_mesh(decimate)
+        traces = [go.Mesh3d(
+            x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2],
+            i=triangles[:, 0], j=triangles[:, 1], k=triangles[:, 2],
+            intensity=vertices[:, 2],
+            colorscale='Earth',
+            flatshading=True,
+        )]
+    else:
+        raise AttributeError(f'Unexpected plot mode: {mode}')
+
+    layout = go.Layout(
+        title='Height Map',
+        scene=dict(
+            xaxis=dict(
+                gridcolor='rgb(255, 255, 255)',
+                zerolinecolor='rgb(255, 255, 255)',
+                showbackground=True,
+                backgroundcolor='rgb(230, 230,230)'
+            ),
+            yaxis=dict(
+                gridcolor='rgb(255, 255, 255)',
+                zerolinecolor='rgb(255, 255, 255)',
+                showbackground=True,
+                backgroundcolor='rgb(230, 230,230)'
+            ),
+            zaxis=dict(
+                gridcolor='rgb(255, 255, 255)',
+                zerolinecolor='rgb(255, 255, 255)',
+                showbackground=True,
+                backgroundcolor='rgb(230, 230,230)'
+            ),
+            aspectratio=dict(
+                x=1,
+                y=1,
+                z=0.2
+            )
+        ),
+        showlegend=False,
+    )
+
+    fig = go.Figure(data=traces, layout=layout)
+    if show:
+        fig.show()
+    return fig
+
+
+def plot_Voronoi_grid(
+    points, vertices, regions, neighbors, centroids=None
+):
+    plt.figure(figsize=(10, 10))
+    plt.rcParams['axes.facecolor'] = 'grey'
+    for region in regions:
+        region.append(region[0])
+        coords = vertices[region]
+        plt.plot(coords[:, 0], coords[:, 1], c='white')
+    for i, n_list in enumerate(neighbors):
+        p1 = points[i]
+        for i2 in n_list:
+            p2 = points[i2]
+            plt.plot([p1[0], p2[0]], [p1[1], p2[1]], c='black')
+    plt.scatter(points[:, 0], points[:, 1], c='red')
+    plt.scatter(vertices[:, 0], vertices[:, 1], c='blue')
+    if centroids is not None:
+        plt.scatter(centroids[:, 0], centroids[:, 1], c='green')
+    plt.xlim(0, 1)
+    plt.ylim(0, 1)
+    plt.show()
+
+
+def _center_to_terrain_color(center):
+    if center.terrain_type is TerrainType.LAND:
+        cmap = matplotlib.colormaps['Greens']
+        color = cmap(1.0 - center.height)
+    elif center.terrain_type is TerrainType.OCEAN:
+        color = 'deepskyblue'
+    elif center.terrain_type is TerrainType.COAST:
+        color = 'khaki'
+    elif center.terrain_type is TerrainType.LAKE:
+        color = 'royalblue'
+    else:
+        raise AttributeError(f'Unexpected terrain type: {center.terrain_type}')
+    return color
+
+
+def _center_to_height_color(center):
+    if center.terrain_type is TerrainType.LAND or center.terrain_type is TerrainType.COAST:
+        cmap = matplotlib.colormaps['Greens']
+        color = cmap(1.0 - center.height)
+    elif center.terrain_type is TerrainType.OCEAN:
+        color = 'deepskyblue'
+    elif center.terrain_type is TerrainType.LAKE:
+        color = 'royalblue'
+    else:
+        raise AttributeError(f'Unexpected terrain type: {center.terrain_type}')
+    return color
+
+
+def _center_to_moisture_color(center):
+    if center.terrain_type is TerrainType.LAND or center.terrain_type is TerrainType.COAST:
+        cmap = matplotlib.colormaps['YlGn']
+        color = cmap(center.moisture)
+    elif center.terrain_type is TerrainType.OCEAN:
+        color = 'deepskyblue'
+    elif center.terrain_type is TerrainType.LAKE:
+        color = 'royalblue'
+    else:
+        raise AttributeError(f'Unexpected terrain type: {center.terrain_type}')
+    return color
+
+
+def _center_to_biome_color(center):
+    if center.biome == BiomeType.OCEAN: color = 'deepskyblue'
+    elif center.biome == BiomeType.LAKE: color = 'royalblue'
+    elif center.biome == BiomeType.COAST: color = 'khaki'
+    elif center.biome == BiomeType.SNOW: color = (248/255, 248/255, 248/255)
+    elif center.biome == BiomeType.TUNDRA: color = (227/255, 228/255, 224/255)
+    elif center.biome == BiomeType.BARE: color = (200/255, 198/255, 195/255)
+    elif center.biome == BiomeType.SCORCHED: color = (123/255, 123/255, 123/255)
+    elif center.biome == BiomeType.TAIGA: color = (188/255, 214/255, 144/255)
+    elif center.biome == BiomeType.SHRUBLAND: color = (211/255, 224/255, 150/255)
+    elif center.biome == BiomeType.TEMPERATE_DESERT: color = (208/255, 203/255, 165/255)
+    elif center.biome == BiomeType.TEMPERATE_RAIN_FOREST: color = (55/255, 111/255, 44/255)
+    elif center.biome == BiomeType.TEMPERATE_DECIDOUS_FOREST: color = (123/255, 164/255, 91/255)
+    elif center.biome == BiomeType.GRASSLAND: color = (160/255, 195/255, 121/255)
+    elif center.biome == BiomeType.TROPICAL_RAIN_FOREST: color = (32/255, 78/255, 23/255)
+    elif center.biome == BiomeType.TROPICAL_SEASONAL_FOREST: color = (91/255, 124/255, 64/255)
+    elif center.biome == BiomeType.SUBTROPICAL_DESERT: color = (230/255, 225/255, 168/255)
+    elif center.biome == BiomeType.MARSH: color = (148/255, 217/255, 200/255)
+    elif center.biome == BiomeType.ICE: color = 'lightcyan'
+    elif center.biome == BiomeType.DEEPOCEAN: color = 'dodgerblue'
+    else:
+        raise AttributeError(f'Unexpected biome type: {center.biome}')
+    return color
+
+
+def _center_to_polygon(center, plot_type):
+    """
+    Helper function for plotting, which takes the center and returns a polygon which can be plotted.
+    """
+    if plot_type == 'terrain':
+        color = _center_to_terrain_color(center)
+    elif plot_type == 'moisture':
+        color = _center_to_moisture_color(center)
+    elif plot_type == 'height':
+        color = _center_to_height_color(center)
+    elif plot_type == 'biome':
+        color = _center_to_biome_color(center)
+    else:
+        raise AttributeError(f'Unexpected plot type: {plot_type}')
+
+    corner_coordinates = np.array([[corner.x, corner.y] for corner in center.corners])
+    if _is_center_a_map_corner(center):
+        corner_coordinates = np.append(corner_coordinates, _nearest_map_corner(corner_coordinates))
+        corner_coordinates = corner_coordinates.reshape(-1, 2)
+    hull = ConvexHull(corner_coordinates)
+    vertices = hull.vertices
+    vertices = np.append(vertices, vertices[0])
+    xs, ys = corner_coordinates[vertices, 0], corner_coordinates[vertices, 1]
+    return Polygon(np.c_[xs, ys], facecolor=color, edgecolor='black', linewidth=2)
+
+
+def _is_center_a_map_corner(center):
+    """
+    Function returns True only when a center is in a one of 4 corners of the [0, 1]^2.
+    """
+    corner_coordinates = np.array([[corner.x, corner.y] for corner in center.corners])
+    xs, ys = corner_coordinates.T
+    return (np.any(xs == 0) or np.any(xs == 1)) and (np.any(ys == 0) or np.any(ys == 1))
+
+
+def _nearest_map_corner(corner_coordinates):
+    """
+    Assumes that a coordinates belong to the corner being in the corner of the map.
+    """
+    if np.any(corner_coordinates[:, 0] == 0):
+        if np.any(corner_coordinates[:, 1] == 0):
+            return [0, 0]
+        else:
+            return [0, 1]
+    else:
+        if np.any(corner_coordinates[:, 1] == 0):
+            return [1, 0]
+        else:
+            return [1, 1]
@@ -0,0 +1,25 @@
+from __future__ import absolute_import
+import numpy as np
+from typing import *
+
+
+# Stages of the pipeline drawing random numbers, every one of them gets an independent stream.
+STAGES = ('points', 'terrain', 'rivers')
+
+
+def stage_seeds(seed: Union[int, np.random.SeedSequence]) -> Dict[str, np.random.SeedSequence]:
+    """
+    Independent child seed sequences of `seed` (see `SeedSequence.spawn`) for every stage in `STAGES`.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return dict(zip(STAGES, seed.spawn(len(STAGES))))
+
+
+def randint(rng, low: int, high: Optional[int] = None, size=None):
+    """
+    `np.random.randint` for both a `np.random.Generator` and the legacy global state (`np.random`).
+    """
+    if isinstance(rng, np.random.Generator):
+        return rng.integers(low, high, size)
+    return rng.randint(low, high, size)
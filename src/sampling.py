@@ -0,0 +1,142 @@
+"""
+Poisson-disk sampling of the points of the polygons (Bridson, "Fast Poisson Disk Sampling in Arbitrary Dimensions").
+
+Every point keeps a minimal distance from the others, so the Voronoi polygons of the points have similar sizes
+without (or after a single) Lloyd relaxation. With a density function the distance varies over the map:
+it's proportional to 1 / sqrt(density), so the number of points per area follows the density.
+"""
+from __future__ import absolute_import
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import *
+
+# Points of the sampling per area, times the squared minimal distance (measured on the unit square).
+PACKING_DENSITY = 0.63
+# Unsuccessful candidates in a row after which an active point is retired.
+ATTEMPTS = 30
+# Side of the grid on which the density function is averaged to find the minimal distance for N points.
+DENSITY_GRID = 64
+
+
+def quadrant_density(alpha: float, corner: Sequence[float]) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Density of `VoronoiPolygons.generate_points`: `alpha` of the points are in the quarter of the map
+    whose lower left corner is `corner` (e.g. (0.5, 0)), the rest are spread over the whole map.
+    """
+    x0, y0 = corner
+
+    def density(points: np.ndarray) -> np.ndarray:
+        inside = (x0 <= points[:, 0]) & (points[:, 0] < x0 + 0.5) & (y0 <= points[:, 1]) & (points[:, 1] < y0 + 0.5)
+        return (1 - alpha) + 4 * alpha * inside
+    return density
+
+
+def poisson_disk(
+    N: int,
+    rng=None,
+    density: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    attempts: int = ATTEMPTS,
+) -> np.ndarray:
+    """
+    About N points in [0, 1)^2, no two of them closer than the minimal distance at the point added later.
+
+    Bridson's sampling run for all the active points at once: in every round every active point draws
+    a candidate in the annulus between its distance and twice its distance, and the candidates far enough
+    from all the points and from the earlier candidates of the round become new active points.
+    An active point is retired after `attempts` unsuccessful candidates in a row.
+    :param rng: random generator, defaults to the global state `np.random`
+    :param density: function of an array of points (m x 2) returning their (positive) relative densities
+    :param attempts: more attempts give a denser packing
+    :return: array of the points (about N x 2, the exact number depends on the sampling)
+    """
+    if N < 1:
+        raise ValueError(f'N has to be positive, got {N}.')
+    if rng is None:
+        rng = np.random
+
+    if density is None:
+        mean_to_max = 1.0
+    else:
+        ticks = (np.arange(DENSITY_GRID) + 0.5) / DENSITY_GRID
+        values = np.asarray(density(np.stack(np.meshgrid(ticks, ticks), axis=-1).reshape(-1, 2)), dtype=np.float64)
+        if not np.all(np.isfinite(values)) or np.any(values <= 0):
+            raise ValueError('The density has to be positive.')
+        max_density = values.max()
+        mean_to_max = values.mean() / max_density
+
+    # The distance where the density is the highest, the distance elsewhere is never shorter.
+    min_distance = math.sqrt(PACKING_DENSITY * mean_to_max / N)
+
+    def distances(points: np.ndarray) -> np.ndarray:
+        if density is None:
+            return np.full(len(points), min_distance)
+        values = np.asarray(density(points), dtype=np.float64)
+        return min_distance * np.sqrt(max_density / np.maximum(values, max_density * 1e-6))
+
+    # Cells of the grid are small enough to hold at most one point, grid[x, y] is its index or -1.
+    cell = min_distance / math.sqrt(2)
+    size = int(math.ceil(1 / cell))
+    grid = np.full((size, size), -1, dtype=np.int64)
+
+    capacity = 2 * N + 16
+    points = np.empty((capacity, 2))
+    radii = np.empty(capacity)
+    failures = np.zeros(capacity, dtype=np.int64)
+    points[0] = rng.random(2)
+    radii[0] = distances(points[:1])[0]
+    grid[min(int(points[0, 0] / cell), size - 1), min(int(points[0, 1] / cell), size - 1)] = 0
+    n = 1
+    active = np.zeros(1, dtype=np.int64)
+
+    while len(active) > 0:
+        angles = 2 * np.pi * rng.random(len(active))
+        lengths = radii[active] * (1 + rng.random(len(active)))
+        candidates = points[active] + np.column_stack([lengths * np.cos(angles), lengths * np.sin(angles)])
+        candidates = np.clip(candidates, 0, 1)
+        accepted = np.all(candidates < 1, axis=1) & np.all(candidates > 0, axis=1)
+        candidate_radii = distances(candidates)
+
+        # Candidates too close to the points, which can only be in the cells within the largest distance.
+        cells = np.minimum((candidates / cell).astype(np.int64), size - 1)
+        max_radius = candidate_radii.max()
+        reach = int(math.ceil(max_radius / cell))
+        dx, dy = np.meshgrid(np.arange(-reach, reach + 1), np.arange(-reach, reach + 1), indexing='ij')
+        near = (np.maximum(np.abs(dx) - 1, 0) ** 2 + np.maximum(np.abs(dy) - 1, 0) ** 2) * cell ** 2 < max_radius ** 2
+        xs = cells[:, 0, None] + dx[near]
+        ys = cells[:, 1, None] + dy[near]
+        neighbors = grid[np.clip(xs, 0, size - 1), np.clip(ys, 0, size - 1)]
+        neighbors[(xs < 0) | (xs >= size) | (ys < 0) | (ys >= size)] = -1
+        rows, columns = np.nonzero(neighbors >= 0)
+        others = neighbors[rows, columns]
+        squared = (points[others, 0] - candidates[rows, 0]) ** 2 + (points[others, 1] - candidates[rows, 1]) ** 2
+        accepted[rows[squared < candidate_radii[rows] ** 2]] = False
+
+        # Candidates too close to an earlier candidate of the round.
+        remaining = np.flatnonzero(accepted)
+        if len(remaining) > 1:
+            pairs = cKDTree(candidates[remaining]).query_pairs(
+                candidate_radii[remaining].max(), output_type='ndarray',
+            )
+            if len(pairs) > 0:
+                first, second = remaining[pairs.min(axis=1)], remaining[pairs.max(axis=1)]
+                squared = ((candidates[first] - candidates[second]) ** 2).sum(axis=1)
+                accepted[second[squared < np.maximum(candidate_radii[first], candidate_radii[second]) ** 2]] = False
+
+        added = np.flatnonzero(accepted)
+        if n + len(added) > capacity:
+            capacity = 2 * (n + len(added))
+            points = np.resize(points, (capacity, 2))
+            radii = np.resize(radii, capacity)
+            failures = np.resize(failures, capacity)
+        new = np.arange(n, n + len(added))
+        points[new] = candidates[added]
+        radii[new] = candidate_radii[added]
+        failures[new] = 0
+        grid[cells[added, 0], cells[added, 1]] = new
+        n += len(added)
+
+        failures[active] = np.where(accepted, 0, failures[active] + 1)
+        active = np.concatenate([active[failures[active] < attempts], new])
+
+    return points[:n].copy()
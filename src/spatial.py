@@ -0,0 +1,243 @@
+"""
+Spatial index of a map for runtime queries: the cell containing a position and the nearest corner or edge
+(of the whole map, of the rivers or of the coast), for whole batches of positions at once.
+
+The polygons are the Voronoi cells of the centers (clipped to [0, 1]^2), so the cell containing a position
+is the cell of its nearest center.
+"""
+from __future__ import absolute_import
+import math
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import *
+
+from src.arrays import ArrayGraph
+from src.terrain import TerrainType
+
+# Buckets of the grid of `NearestPoint` per point.
+BUCKETS_PER_POINT = 4
+# Candidates kept for a bucket of `NearestPoint`, the positions in buckets with more are queried in the KD-tree.
+MAX_CANDIDATES = 12
+# Positions processed at once, bounds the memory of the temporary (positions x candidates) arrays.
+CHUNK = 65536
+
+CORNER_SETS = ('all', 'river', 'coast')
+EDGE_SETS = ('all', 'river', 'coastline')
+
+
+def _positions(positions) -> np.ndarray:
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.shape[-1:] != (2,):
+        raise ValueError(f'Positions have to be of shape (..., 2), got {positions.shape}.')
+    return positions.reshape(-1, 2)
+
+
+def _nearest(positions, ids: np.ndarray, index) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Query of `NearestPoint` or `NearestSegment` of a subset, with the results mapped to `ids` of the subset.
+    """
+    shape = np.shape(positions)[:-1]
+    found, distances = index.query(positions)
+    if len(ids) > 0:
+        found = np.where(found >= 0, ids[np.maximum(found, 0)], -1)
+    return found.reshape(shape), distances.reshape(shape)
+
+
+class NearestPoint:
+    """
+    Nearest of a set of points for batches of positions.
+
+    Every bucket of a grid over [0, 1]^2 keeps all the points which can be the nearest one to a position
+    in the bucket (found with a KD-tree): the points closer to the middle of the bucket than the distance
+    of the nearest one plus the diagonal of the bucket. A query only compares a position with the few
+    points of its bucket. Positions outside of [0, 1]^2 and in the rare buckets with more than
+    `MAX_CANDIDATES` points are queried in the KD-tree.
+    """
+
+    def __init__(self, xy: np.ndarray):
+        self.xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+        self.tree = cKDTree(self.xy) if len(self.xy) > 0 else None
+        self.size = max(1, int(math.ceil(math.sqrt(BUCKETS_PER_POINT * len(self.xy)))))
+        if self.tree is None:
+            self.candidates = np.full((self.size ** 2, 1), -1, dtype=np.int64)
+            return
+
+        ticks = (np.arange(self.size) + 0.5) / self.size
+        middles = np.stack(np.meshgrid(ticks, ticks, indexing='ij'), axis=-1).reshape(-1, 2)
+        k = min(MAX_CANDIDATES + 1, len(self.xy))
+        distances, candidates = self.tree.query(middles, k=k)
+        distances, candidates = distances.reshape(len(middles), k), candidates.reshape(len(middles), k)
+        # Any position of a bucket is at most half of the diagonal from its middle.
+        half_diagonal = math.sqrt(2) / 2 / self.size
+        reach = distances[:, :1] + 2 * half_diagonal + 1e-12
+        candidates[distances > reach] = -1
+        # Buckets with more candidates than MAX_CANDIDATES (all of the k points are within the reach)
+        # are marked with -2 and their positions are queried in the KD-tree.
+        overflow = (distances[:, -1] <= reach[:, 0]) & (k == MAX_CANDIDATES + 1)
+        width = max(1, int((candidates[~overflow] >= 0).sum(axis=1).max(initial=1)))
+        self.candidates = np.ascontiguousarray(candidates[:, :width])
+        self.candidates[overflow] = -2
+
+    def query(self, positions) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index of the nearest point and the distance to it for every position (-1 and inf without points).
+        """
+        positions = _positions(positions)
+        ids = np.full(len(positions), -1, dtype=np.int64)
+        distances = np.full(len(positions), np.inf)
+        if self.tree is None:
+            return ids, distances
+
+        inside = np.all((positions >= 0) & (positions <= 1), axis=1)
+        for start in range(0, len(positions), CHUNK):
+            chunk = positions[start:start + CHUNK]
+            buckets = np.minimum((chunk * self.size).astype(np.int64), self.size - 1)
+            candidates = self.candidates[np.clip(buckets[:, 0], 0, self.size - 1) * self.size
+                                         + np.clip(buckets[:, 1], 0, self.size - 1)]
+            points = np.maximum(candidates, 0)
+            squared = (self.xy[points, 0] - chunk[:, 0, None]) ** 2 + (self.xy[points, 1] - chunk[:, 1, None]) ** 2
+            squared[candidates < 0] = np.inf
+            best = squared.argmin(axis=1)
+            rows = np.arange(len(chunk))
+            ids[start:start + CHUNK] = candidates[rows, best]
+            distances[start:start + CHUNK] = np.sqrt(squared[rows, best])
+
+        rest = np.flatnonzero(~inside | (ids == -2))
+        if len(rest) > 0:
+            distances[rest], ids[rest] = self.tree.query(positions[rest])
+        return ids, distances
+
+
+class NearestSegment:
+    """
+    Nearest of a set of segments for batches of positions: a KD-tree of the middles of the segments gives
+    the candidates, and more of them are taken until no other segment can be closer (the distance to
+    a segment is at least the distance to its middle minus half of its length).
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray):
+        self.starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+        self.ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+        self.tree = cKDTree((self.starts + self.ends) / 2) if len(self.starts) > 0 else None
+        lengths = np.sqrt(((self.ends - self.starts) ** 2).sum(axis=1))
+        self.half_length = lengths.max() / 2 if len(lengths) > 0 else 0.0
+
+    def _distances(self, positions: np.ndarray, segments: np.ndarray) -> np.ndarray:
+        a, b = self.starts[segments], self.ends[segments]
+        direction = b - a
+        squared_length = (direction ** 2).sum(axis=-1)
+        t = ((positions[:, None] - a) * direction).sum(axis=-1) / np.where(squared_length > 0, squared_length, 1)
+        closest = a + np.clip(t, 0, 1)[..., None] * direction
+        return np.sqrt(((positions[:, None] - closest) ** 2).sum(axis=-1))
+
+    def query(self, positions, k: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index of the nearest segment and the distance to it for every position (-1 and inf without segments).
+        :param k: number of candidates taken at first, doubled for the positions which need more
+        """
+        positions = _positions(positions)
+        ids = np.full(len(positions), -1, dtype=np.int64)
+        distances = np.full(len(positions), np.inf)
+        if self.tree is None:
+            return ids, distances
+
+        remaining = np.arange(len(positions))
+        farthest = np.empty(len(positions))
+        k = min(k, len(self.starts))
+        while len(remaining) > 0:
+            for start in range(0, len(remaining), CHUNK):
+                rows = remaining[start:start + CHUNK]
+                middle_distances, candidates = self.tree.query(positions[rows], k=k)
+                candidates, middle_distances = candidates.reshape(len(rows), k), middle_distances.reshape(len(rows), k)
+                segment_distances = self._distances(positions[rows], candidates)
+                best = segment_distances.argmin(axis=1)
+                ids[rows] = candidates[np.arange(len(rows)), best]
+                distances[rows] = segment_distances[np.arange(len(rows)), best]
+                farthest[rows] = middle_distances[:, -1]
+            if k == len(self.starts):
+                break
+            # Segments beyond the k-th middle can still be closer when their middle is within half of a length.
+            remaining = remaining[farthest[remaining] - self.half_length < distances[remaining]]
+            k = min(2 * k, len(self.starts))
+        return ids, distances
+
+
+class SpatialIndex:
+    """
+    Queries of the cells, corners and edges of a map by position. Every query takes positions of shape (..., 2)
+    and returns arrays of shape (...).
+
+        index = graph.spatial_index()
+        cells = index.cell(positions)  # -1 outside of the map
+        corners, distances = index.nearest_corner(positions, 'river')
+        edges, distances = index.nearest_edge(positions, 'coastline')
+
+    The indices of the corners and edges of the river and coast sets are taken from the columns of the arrays
+    when the set is first used, `refresh` drops them after the columns change.
+    """
+
+    def __init__(self, arrays: ArrayGraph):
+        self.arrays = arrays
+        self._centers = NearestPoint(arrays.center_xy)
+        self._corners = {}
+        self._edges = {}
+
+    def refresh(self) -> None:
+        self._corners.clear()
+        self._edges.clear()
+
+    def cell(self, positions) -> np.ndarray:
+        """
+        Index of the center whose polygon contains the position, -1 for positions outside of [0, 1]^2.
+        """
+        shape = np.shape(positions)[:-1]
+        positions = _positions(positions)
+        ids, _ = self._centers.query(positions)
+        ids[~np.all((positions >= 0) & (positions <= 1), axis=1)] = -1
+        return ids.reshape(shape)
+
+    def corner_ids(self, which: str = 'all') -> np.ndarray:
+        """
+        Indices of the corners of the set: 'all', 'river' (with a river) or 'coast' (of the coast terrain type).
+        """
+        if which not in CORNER_SETS:
+            raise ValueError(f'Unexpected set of corners: {which}')
+        if which == 'all':
+            return np.arange(self.arrays.n_corners)
+        elif which == 'river':
+            return np.flatnonzero(self.arrays.corner_river > 0)
+        return np.flatnonzero(self.arrays.corner_terrain == TerrainType.COAST.value)
+
+    def edge_ids(self, which: str = 'all') -> np.ndarray:
+        """
+        Indices of the edges of the set: 'all', 'river' (with a river) or 'coastline' (between ocean and land).
+        """
+        if which not in EDGE_SETS:
+            raise ValueError(f'Unexpected set of edges: {which}')
+        if which == 'all':
+            return np.arange(self.arrays.n_edges)
+        elif which == 'river':
+            return np.flatnonzero(self.arrays.edge_river > 0)
+        return self.arrays.coastline_edges()
+
+    def nearest_corner(self, positions, which: str = 'all') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index of the nearest corner of the set (see `corner_ids`) and the distance to it, -1 and inf when
+        the set is empty.
+        """
+        if which not in self._corners:
+            ids = self.corner_ids(which)
+            self._corners[which] = ids, NearestPoint(self.arrays.corner_xy[ids])
+        return _nearest(positions, *self._corners[which])
+
+    def nearest_edge(self, positions, which: str = 'all') -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Index of the nearest edge of the set (see `edge_ids`), as the segment between its corners,
+        and the distance to it, -1 and inf when the set is empty.
+        """
+        if which not in self._edges:
+            ids = self.edge_ids(which)
+            corner_xy = self.arrays.corner_xy
+            segments = NearestSegment(corner_xy[self.arrays.edge_v0[ids]], corner_xy[self.arrays.edge_v1[ids]])
+            self._edges[which] = ids, segments
+        return _nearest(positions, *self._edges[which])
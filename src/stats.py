@@ -0,0 +1,135 @@
+"""
+Instrumentation of the map generation: wall time, CPU time, peak allocated memory and counters of every stage.
+
+Nothing is recorded unless the graph has a `GenerationStats` (`Graph(..., stats=GenerationStats())`
+or `graph.stats = GenerationStats()`); without it the instrumented functions only check that `graph.stats` is None.
+"""
+from __future__ import absolute_import
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import *
+
+
+class StageStats:
+    """
+    What was recorded for a single run of a stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        # Peak of the memory allocated during the stage (above the memory allocated before it), in bytes.
+        # None when it's not measured.
+        self.peak_bytes = None
+        self.counts = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'wall_time': self.wall_time,
+            'cpu_time': self.cpu_time,
+            'peak_bytes': self.peak_bytes,
+            'counts': dict(self.counts),
+        }
+
+    def __repr__(self):
+        return f'StageStats({self.as_dict()})'
+
+
+class GenerationStats:
+    """
+    Stats of all the stages run on a graph, in the order they were run.
+    """
+
+    def __init__(self, callback: Optional[Callable[[StageStats], None]] = None, memory: bool = False):
+        """
+        :param callback: called with the stats of every stage when it ends, e.g. to forward them to a metrics system
+        :param memory: whether to measure the peak memory of the stages, with tracemalloc, which makes
+            the stages several times slower (so their times are only meaningful without it)
+        """
+        self.callback = callback
+        self.memory = memory
+        self.stages = []
+        self._current = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageStats]:
+        """
+        Records the code run in the context as the stage. Stages run inside another stage are recorded
+        separately, but their memory is only measured as a part of the outer stage.
+        """
+        record = StageStats(name)
+        outer, self._current = self._current, record
+        measure_memory = self.memory and outer is None
+        started_tracing = False
+        if measure_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            elif hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                # The peak of the running trace can't be reset before Python 3.9.
+                measure_memory = False
+            allocated_before = tracemalloc.get_traced_memory()[0] if measure_memory else 0
+
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_time = time.perf_counter() - wall_start
+            record.cpu_time = time.process_time() - cpu_start
+            if measure_memory:
+                record.peak_bytes = tracemalloc.get_traced_memory()[1] - allocated_before
+            if started_tracing:
+                tracemalloc.stop()
+            self._current = outer
+            self.stages.append(record)
+            if self.callback is not None:
+                self.callback(record)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Adds the value to the counter of the current stage.
+        """
+        if self._current is not None:
+            self._current.counts[name] = self._current.counts.get(name, 0) + int(value)
+
+    def __getitem__(self, name: str) -> StageStats:
+        """
+        Stats of the last run of the stage.
+        """
+        for record in reversed(self.stages):
+            if record.name == name:
+                return record
+        raise KeyError(name)
+
+    def as_dict(self) -> List[Dict[str, Any]]:
+        return [record.as_dict() for record in self.stages]
+
+    def summary(self) -> str:
+        lines = [f'{"stage":>24} {"wall [s]":>10} {"cpu [s]":>10} {"peak [MiB]":>11}  counts']
+        for record in self.stages:
+            peak = f'{record.peak_bytes / 2 ** 20:11.1f}' if record.peak_bytes is not None else f'{"-":>11}'
+            counts = ', '.join(f'{name}={value}' for name, value in record.counts.items())
+            lines.append(f'{record.name:>24} {record.wall_time:10.4f} {record.cpu_time:10.4f} {peak}  {counts}')
+        return '\n'.join(lines)
+
+
+def instrumented(stage: str):
+    """
+    Decorator recording the function (or method) as the stage in `graph.stats`, where the graph is its first argument.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(graph, *args, **kwargs):
+            stats = graph.stats
+            if stats is None:
+                return function(graph, *args, **kwargs)
+            with stats.stage(stage):
+                return function(graph, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,83 @@
+"""
+Versioned on-disk format of a generated map: a directory with every array of its `ArrayGraph` as a `.npy` file
+and `manifest.json` describing them. The arrays are loaded with `np.load(mmap_mode='r')`, so opening a map
+only maps the files, and the object graph is created only when it's needed.
+"""
+from __future__ import absolute_import
+import json
+import os
+import numpy as np
+from typing import *
+
+from src.arrays import ArrayGraph
+
+FORMAT = 'polygonal-map'
+VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+class StoredMap:
+    """
+    A map opened with `load`: `arrays` is the `ArrayGraph` over the (memory mapped) arrays and `graph`
+    is the object graph, created from the arrays on first access.
+    """
+
+    def __init__(self, arrays: ArrayGraph, metadata: Dict[str, Any]):
+        self.arrays = arrays
+        self.metadata = metadata
+        self._graph = None
+
+    @property
+    def graph(self):
+        if self._graph is None:
+            # Imported here, opening a map shouldn't pay for importing the generation code.
+            from src.map import Graph
+            self._graph = Graph.from_arrays(self.arrays, seed=self.metadata.get('seed'))
+        return self._graph
+
+
+def save(graph, path: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Saves a `Graph` (with the attributes of its objects) or an `ArrayGraph` in the directory `path`.
+    :param metadata: JSON serializable values saved in the manifest, e.g. the seed and parameters of the map
+    """
+    if isinstance(graph, ArrayGraph):
+        arrays = graph
+    else:
+        arrays = graph.arrays
+        arrays.pull(graph)
+        if metadata is None and graph.seed_sequences is not None:
+            metadata = {'seed': graph.seed_sequences['points'].entropy}
+
+    os.makedirs(path, exist_ok=True)
+    entries = {}
+    for name, array in arrays.to_dict().items():
+        array = np.ascontiguousarray(array)
+        np.save(os.path.join(path, f'{name}.npy'), array, allow_pickle=False)
+        entries[name] = {'file': f'{name}.npy', 'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+    # The manifest is written last, a directory without it is not a (complete) map.
+    manifest = {'format': FORMAT, 'version': VERSION, 'arrays': entries, 'metadata': metadata or {}}
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def load(path: str, mmap_mode: Optional[str] = 'r') -> StoredMap:
+    """
+    Opens a map saved with `save`.
+    :param mmap_mode: passed to `np.load`, 'r' maps the arrays read-only without reading them, None reads them
+    """
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f'{path} is not a saved map.')
+    if manifest.get('version') != VERSION:
+        raise ValueError(f'Unsupported version of the map format: {manifest.get("version")}, expected {VERSION}.')
+
+    arrays = {}
+    for name, entry in manifest['arrays'].items():
+        array = np.load(os.path.join(path, entry['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        if array.dtype.str != entry['dtype'] or list(array.shape) != entry['shape']:
+            raise ValueError(f'Array {name} of {path} doesn\'t match the manifest.')
+        arrays[name] = array
+    return StoredMap(ArrayGraph(**arrays), manifest['metadata'])
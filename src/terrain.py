@@ -3,6 +3,9 @@ from collections import deque
 from enum import Enum
 import numpy as np
 
+from src.rng import randint
+from src.stats import instrumented
+
 class TerrainType(Enum):
     OCEAN = 1
     LAND = 2
@@ -30,6 +33,22 @@ class BiomeType(Enum):
     ICE = 18
     DEEPOCEAN = 19
 
+# Biomes of the land centers (Whittaker diagram), from the lowest band of heights to the highest.
+# Every band is (upper height bound, moisture bounds, biomes): a center is in the first band whose bound is not lower
+# than its height and gets the i-th biome of the band when its moisture is greater than exactly i moisture bounds.
+BIOME_TABLE = (
+    (0.4, (0.3, 0.45, 0.66), (BiomeType.SUBTROPICAL_DESERT, BiomeType.GRASSLAND,
+                              BiomeType.TROPICAL_SEASONAL_FOREST, BiomeType.TROPICAL_RAIN_FOREST)),
+    (0.66, (0.3, 0.6, 0.8), (BiomeType.TEMPERATE_DESERT, BiomeType.GRASSLAND,
+                             BiomeType.TEMPERATE_DECIDOUS_FOREST, BiomeType.TEMPERATE_RAIN_FOREST)),
+    (0.87, (0.33, 0.66), (BiomeType.TEMPERATE_DESERT, BiomeType.SHRUBLAND, BiomeType.TAIGA)),
+    (np.inf, (0.22, 0.44, 0.66), (BiomeType.SCORCHED, BiomeType.BARE, BiomeType.TUNDRA, BiomeType.SNOW)),
+)
+
+# Lakes lower than that are marshes and higher are frozen.
+MARSH_MAX_HEIGHT = 0.2
+ICE_MIN_HEIGHT = 0.9
+
 # Minimum ratio of the water edges to the total, in order to center become a water.
 MIN_WATER_EDGES_RATIO_TO_BE_WATER_CENTER = 0.25
 
@@ -39,15 +58,88 @@ OCEAN_TO_TOTAL_RATIO = 0.4
 
 LAKE_TO_TOTAL_RATIO = 0.025
 
+class _EdgeList:
+    """
+    List of edges, appended to its end and removed from anywhere, in blocks of at most `BLOCK` edges.
+    A Fenwick tree counts the edges of the blocks (except for the last one, which is still being filled), so finding
+    the k-th edge and removing it take O(log n) plus shifting the rest of its block, and appending takes O(1).
+    """
+    BLOCK = 256
+
+    def __init__(self, edges):
+        edges = list(edges)
+        self.blocks = [edges[i:i + self.BLOCK] for i in range(0, len(edges), self.BLOCK)] or [[]]
+        self._size = len(edges)
+        self._build(2 * len(self.blocks) + 16)
+
+    def __len__(self):
+        return self._size
+
+    def _build(self, capacity):
+        # Linear construction: every node passes its count to its parent.
+        tree = [0] * (capacity + 1)
+        tree[1:len(self.blocks)] = map(len, self.blocks[:-1])
+        for i in range(1, capacity + 1):
+            parent = i + (i & -i)
+            if parent <= capacity:
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._capacity = capacity
+        self._top = 1 << capacity.bit_length() - 1
+
+    def _add(self, block, value):
+        tree, capacity = self._tree, self._capacity
+        i = block + 1
+        while i <= capacity:
+            tree[i] += value
+            i += i & -i
+
+    def append(self, edge):
+        last = self.blocks[-1]
+        if len(last) == self.BLOCK:
+            if len(self.blocks) >= self._capacity:
+                self._build(2 * len(self.blocks))
+            self._add(len(self.blocks) - 1, len(last))
+            last = []
+            self.blocks.append(last)
+        last.append(edge)
+        self._size += 1
+
+    def find(self, k):
+        """
+        Block of the k-th (from 0) edge of the list and its position in the block.
+        """
+        in_tree = self._size - len(self.blocks[-1])
+        if k >= in_tree:
+            return len(self.blocks) - 1, k - in_tree
+        tree, capacity = self._tree, self._capacity
+        block, step = 0, self._top
+        while step:
+            if block + step <= capacity and tree[block + step] <= k:
+                block += step
+                k -= tree[block]
+            step >>= 1
+        return block, k
+
+    def remove(self, block, position):
+        del self.blocks[block][position]
+        self._size -= 1
+        if block < len(self.blocks) - 1:
+            self._add(block, -1)
+
+
+@instrumented('terrain')
 def assign_terrain_types_to_graph(
     graph,
     min_water_ratio=MIN_WATER_EDGES_RATIO_TO_BE_WATER_CENTER,
     chance_of_water_edge_in_middle=CHANCE_OF_WATER_EDGE_IN_MIDDLE,
     ocean_to_total_ratio=OCEAN_TO_TOTAL_RATIO,
     lake_to_total_ratio=LAKE_TO_TOTAL_RATIO,
+    rng=None,
 ):
     """
     :param graph: Mutable graph
+    :param rng: random generator, by default the one of the 'terrain' stage of the graph (see `Graph.rng`)
     
     Sets the corners and centers of the graph to the terrain types.
     Updates the fields of the graph.
@@ -70,57 +162,98 @@ def assign_terrain_types_to_graph(
                        [1. , 0.8],
                        [1. , 1. ]])
     
-    actual_regions_ids = np.random.randint(0,len(regions), 3)
+    if rng is None:
+        rng = graph.rng('terrain')
+    actual_regions_ids = randint(rng, 0,len(regions), 3)
     
-    def is_good_beginner(edge):
-        if edge.is_edge_to_map_end():
+    # The ends of the edges, to test all of them at once whether they're at the end of the map and in the regions.
+    ends = np.array([(edge.v0.x, edge.v0.y, edge.v1.x, edge.v1.y) for edge in graph.edges]).reshape(-1, 4)
+    at_map_end = ((ends == 0) | (ends == 1)).any(axis=1).tolist()
+    in_regions = [
+        ((region[0]-0.2 <= ends[:, 0]) & (ends[:, 0] <= region[0])
+         & (region[1]-0.2 <= ends[:, 1]) & (ends[:, 1] <= region[1])).tolist()
+        for region in regions[actual_regions_ids]
+    ]
+    
+    def is_good_beginner(edge_id):
+        if at_map_end[edge_id]:
             return True
-        for region_id in actual_regions_ids:
-            region = regions[region_id]
-            if region[0]-0.2 <= edge.v0.x <= region[0] \
-              and  region[1]-0.2 <= edge.v0.y <= region[1] \
-              and np.random.random() < 0.5:
+        for in_region in in_regions:
+            if in_region[edge_id] and rng.random() < 0.5:
                 return True
         return False
         
     def is_good_lake_beginner(edge):
 #         return max(edge.v0.x, edge.v0.y, 1.0-edge.v0.x, 1.0-edge.v0.y)**2 \
 #                * chance_of_water_edge_in_middle > np.random.random()
-        return chance_of_water_edge_in_middle > np.random.random()
+        return chance_of_water_edge_in_middle > rng.random()
        
-    water_edges = [edge for edge in graph.edges if is_good_beginner(edge)]
-    unexpanded_water_edges = water_edges
+    edge_ids = {edge: i for i, edge in enumerate(graph.edges)}
+    protruding_edge_ids = [
+        (
+            [edge_ids[edge] for edge in graph_edge.v0.protrudes],
+            [edge_ids[edge] for edge in graph_edge.v1.protrudes],
+        )
+        for graph_edge in graph.edges
+    ]
+    # water_count[i] is the number of times the i-th edge is in the list of the water edges.
+    water_count = bytearray(len(graph.edges))
+
+    # The list of the water edges is also the list of the unexpanded ones, so every new water edge is added to it
+    # twice (right after each other) and expanding an edge removes one of its copies.
+    water_edges = _EdgeList(i for i in range(len(graph.edges)) if is_good_beginner(i))
+    for block in water_edges.blocks:
+        for edge in block:
+            water_count[edge] = 1
     
-    ocean_to_total_ratio += (np.random.rand() - 0.5) / 10
+    ocean_to_total_ratio += (rng.random() - 0.5) / 10
     ocean_edges_expected = int(len(graph.edges) * ocean_to_total_ratio)
     
     while len(water_edges) < ocean_edges_expected:
-        selected_edge_idx = np.random.randint(len(unexpanded_water_edges))
-        selected_edge = unexpanded_water_edges[selected_edge_idx]
-        unexpanded_water_edges.remove(selected_edge)
+        block, position = water_edges.find(randint(rng, len(water_edges)))
+        selected_edge = water_edges.blocks[block][position]
+        water_edges.remove(block, position)
+        water_count[selected_edge] -= 1
         
         # Set all the edges adjacent to the selected one as the ocean.
-        for corner in [selected_edge.v0, selected_edge.v1]:
-            for edge in corner.protrudes:
-                if edge not in water_edges:
+        for protruding_edges in protruding_edge_ids[selected_edge]:
+            for edge in protruding_edges:
+                if not water_count[edge]:
+                    water_count[edge] = 2
+                    water_edges.append(edge)
                     water_edges.append(edge)
-                    unexpanded_water_edges.append(edge)
     
+    water_edges_count = len(water_edges)
     lake_edges_expected = ocean_edges_expected + int(len(graph.edges) * lake_to_total_ratio)
-    unexpanded_water_edges = [edge for edge in graph.edges
-                                      if edge not in water_edges and is_good_lake_beginner(edge)]
+    unexpanded_water_edges = _EdgeList(
+        i for i, edge in enumerate(graph.edges) if not water_count[i] and is_good_lake_beginner(edge)
+    )
+    # An edge can be in the list twice, when it's a lake beginner reached from another lake. Its first copy,
+    # the one removed when it's selected, is then still in the block of the beginners it started in.
+    unexpanded_count = bytearray(len(graph.edges))
+    beginner_blocks = {}
+    for block, edges in enumerate(unexpanded_water_edges.blocks):
+        for edge in edges:
+            unexpanded_count[edge] = 1
+            beginner_blocks[edge] = block
     
-    while len(water_edges) < lake_edges_expected:
-        selected_edge_idx = np.random.randint(len(unexpanded_water_edges))
-        selected_edge = unexpanded_water_edges[selected_edge_idx]
-        unexpanded_water_edges.remove(selected_edge)
+    while water_edges_count < lake_edges_expected:
+        block, position = unexpanded_water_edges.find(randint(rng, len(unexpanded_water_edges)))
+        selected_edge = unexpanded_water_edges.blocks[block][position]
+        if unexpanded_count[selected_edge] > 1:
+            block = beginner_blocks[selected_edge]
+            position = unexpanded_water_edges.blocks[block].index(selected_edge)
+        unexpanded_water_edges.remove(block, position)
+        unexpanded_count[selected_edge] -= 1
         
         # Set all the edges adjacent to the selected one as the ocean.
-        for corner in [selected_edge.v0, selected_edge.v1]:
-            for edge in corner.protrudes:
-                if edge not in water_edges:
-                    water_edges.append(edge)
+        for protruding_edges in protruding_edge_ids[selected_edge]:
+            for edge in protruding_edges:
+                if not water_count[edge]:
+                    water_count[edge] = 1
+                    water_edges_count += 1
                     unexpanded_water_edges.append(edge)
+                    unexpanded_count[edge] += 1
     
     # First set all the water centers which have an edge leading the to end of the map as an oceans. Then mark all of
     # the water centers around them as oceans.
@@ -128,18 +261,22 @@ def assign_terrain_types_to_graph(
     
     # Set all the water centers as the lake.
     for center in graph.centers:
-        if np.mean([border in water_edges for border in center.borders]) >= min_water_ratio:
+        water_borders = sum(water_count[edge_ids[border]] > 0 for border in center.borders)
+        if center.borders and water_borders / len(center.borders) >= min_water_ratio:
             center.terrain_type = TerrainType.LAKE
-            end_map_center = any([edge.is_edge_to_map_end() for edge in center.borders])
+            end_map_center = any([at_map_end[edge_ids[edge]] for edge in center.borders])
             if end_map_center:
                 unexpanded_ocean_centers.append(center)
     
+    # A center becomes an ocean when it's enqueued, so it's enqueued (and expanded) only once.
+    for center in unexpanded_ocean_centers:
+        center.terrain_type = TerrainType.OCEAN
     while len(unexpanded_ocean_centers) > 0:
         center = unexpanded_ocean_centers.popleft()
-        center.terrain_type = TerrainType.OCEAN
         
         for neighbor in center.neighbors:
             if neighbor.terrain_type is TerrainType.LAKE:  # Water center, neighbors with ocean -> it's an ocean.
+                neighbor.terrain_type = TerrainType.OCEAN
                 unexpanded_ocean_centers.append(neighbor)
     
     for center in graph.centers:
@@ -180,4 +317,63 @@ def assign_terrain_types_to_graph(
     for corner in graph.corners:
         corner.height = 0
     for center in graph.centers:
-        center.height = 0
\ No newline at end of file
+        center.height = 0
+
+    if graph.stats is not None:
+        # The edges in the list of the water edges, each of them once (the bound of the loops counts the copies).
+        graph.stats.count('water_edges', len(water_count) - water_count.count(0))
+        for terrain_type in TerrainType:
+            graph.stats.count(
+                f'{terrain_type.name.lower()}_centers',
+                sum(center.terrain_type is terrain_type for center in graph.centers),
+            )
+
+def classify_biomes(
+    terrain,
+    height,
+    moisture,
+    coast_neighbour,
+    table=BIOME_TABLE,
+    marsh_max_height=MARSH_MAX_HEIGHT,
+    ice_min_height=ICE_MIN_HEIGHT,
+):
+    """
+    :param terrain: array of TerrainType values of the centers
+    :param height: array of heights of the centers
+    :param moisture: array of moistures of the centers
+    :param coast_neighbour: mask of the centers which have a coast neighbor
+    :param table: biomes of the land centers, see BIOME_TABLE
+
+    Returns the array of BiomeType values of the centers. All of them are classified at once,
+    with a single `np.digitize` per band of the table. A NaN height or moisture is above no bound,
+    so like in the original if/elif tree it falls into the first band and the first biome.
+    """
+    terrain, height, moisture = np.asarray(terrain), np.asarray(height), np.asarray(moisture)
+    biomes = np.empty(len(terrain), dtype=np.int8)
+
+    land = terrain == TerrainType.LAND.value
+    height_bounds = [upper_height for upper_height, _, _ in table[:-1]]
+    bands = np.digitize(height[land], height_bounds, right=True)
+    bands[np.isnan(height[land])] = 0
+    land_biomes = np.empty(land.sum(), dtype=np.int8)
+    for band, (_, moisture_bounds, band_biomes) in enumerate(table):
+        in_band = bands == band
+        band_biome_values = np.array([biome.value for biome in band_biomes], dtype=np.int8)
+        band_moisture = moisture[land][in_band]
+        columns = np.digitize(band_moisture, moisture_bounds, right=True)
+        columns[np.isnan(band_moisture)] = 0
+        land_biomes[in_band] = band_biome_values[columns]
+    biomes[land] = land_biomes
+
+    coast = terrain == TerrainType.COAST.value
+    biomes[coast] = BiomeType.COAST.value
+
+    ocean = terrain == TerrainType.OCEAN.value
+    biomes[ocean & coast_neighbour] = BiomeType.OCEAN.value
+    biomes[ocean & ~coast_neighbour] = BiomeType.DEEPOCEAN.value
+
+    lake = terrain == TerrainType.LAKE.value
+    biomes[lake] = BiomeType.LAKE.value
+    biomes[lake & (height < marsh_max_height)] = BiomeType.MARSH.value
+    biomes[lake & (height > ice_min_height)] = BiomeType.ICE.value
+    return biomes
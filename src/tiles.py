@@ -0,0 +1,195 @@
+from __future__ import absolute_import
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from typing import *
+from scipy.spatial import Voronoi
+
+from src.arrays import ArrayGraph
+from src.map import Graph
+from src.voronoi import VoronoiPolygons, VertexIndex
+
+
+class TileGrid:
+    """
+    Split of the map ([0, 1]^2) into `tiles_x` x `tiles_y` tiles with `N` points in total.
+
+    The points of a tile only depend on the seed and the position of the tile (they come from
+    `np.random.default_rng([seed, i, j])`), so every worker can generate the points of the neighbouring tiles
+    (the halo) by itself.
+    """
+
+    def __init__(self, N: int, tiles: Union[int, Tuple[int, int]] = 4, seed: int = 0, halo: float = 6.0):
+        """
+        :param N: total number of points
+        :param tiles: number of tiles along x and y, or a single number for a square grid
+        :param seed: seed of the points
+        :param halo: width of the halo around a tile, in mean distances between points
+        """
+        self.tiles_x, self.tiles_y = (tiles, tiles) if np.isscalar(tiles) else tiles
+        self.N = N
+        self.seed = seed
+        self.halo_width = halo / np.sqrt(N)
+
+    @property
+    def tiles(self) -> List[Tuple[int, int]]:
+        return [(i, j) for i in range(self.tiles_x) for j in range(self.tiles_y)]
+
+    def bounds(self, i: int, j: int) -> Tuple[float, float, float, float]:
+        return i / self.tiles_x, j / self.tiles_y, (i + 1) / self.tiles_x, (j + 1) / self.tiles_y
+
+    def tile_size(self, i: int, j: int) -> int:
+        """
+        Number of points of the tile: N split evenly, the first tiles take the rest of the division.
+        """
+        k = i * self.tiles_y + j
+        n_tiles = self.tiles_x * self.tiles_y
+        return self.N // n_tiles + (k < self.N % n_tiles)
+
+    def tile_points(self, i: int, j: int) -> np.ndarray:
+        x0, y0, x1, y1 = self.bounds(i, j)
+        rng = np.random.default_rng([self.seed, i, j])
+        return np.array([x0, y0]) + rng.random((self.tile_size(i, j), 2)) * np.array([x1 - x0, y1 - y0])
+
+    def halo_tiles(self, i: int, j: int) -> List[Tuple[int, int]]:
+        """
+        Tiles (other than (i, j)) which may have points in the halo of the tile (i, j).
+        """
+        reach_x = int(np.ceil(self.halo_width * self.tiles_x))
+        reach_y = int(np.ceil(self.halo_width * self.tiles_y))
+        return [
+            (k, l)
+            for k in range(max(i - reach_x, 0), min(i + reach_x + 1, self.tiles_x))
+            for l in range(max(j - reach_y, 0), min(j + reach_y + 1, self.tiles_y))
+            if (k, l) != (i, j)
+        ]
+
+    def in_halo(self, i: int, j: int, points: np.ndarray) -> np.ndarray:
+        x0, y0, x1, y1 = self.bounds(i, j)
+        h = self.halo_width
+        xs, ys = points[:, 0], points[:, 1]
+        return (x0 - h <= xs) & (xs <= x1 + h) & (y0 - h <= ys) & (ys <= y1 + h)
+
+
+def _relax_tile(grid: TileGrid, i: int, j: int, iterations: int) -> np.ndarray:
+    """
+    First phase: Lloyd relaxation of the points of the tile together with its halo.
+    Returns the relaxed points of the tile only, the halo is relaxed by the neighbouring tiles themselves.
+    """
+    core = grid.tile_points(i, j)
+    halo = np.concatenate([grid.tile_points(k, l) for k, l in grid.halo_tiles(i, j)] + [np.zeros((0, 2))])
+    points = np.vstack([core, halo[grid.in_halo(i, j, halo)]])
+    for _ in range(iterations):
+        coords, offsets = VoronoiPolygons.clip_regions(vor=Voronoi(points))
+        points = VoronoiPolygons.polygon_centroids(coords, offsets)
+    return points[:len(core)]
+
+
+def _tile_regions(core: np.ndarray, halo: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Second phase: clipped Voronoi regions of the (relaxed) points of the tile, with the halo around them.
+    """
+    vor = Voronoi(np.vstack([core, halo]))
+    return VoronoiPolygons.clip_regions(vor=vor, indices=np.arange(len(core)))
+
+
+def stitch_regions(
+    coords: np.ndarray,
+    offsets: np.ndarray,
+) -> Tuple[np.ndarray, List[List[int]], List[List[int]], List[List[List[int]]]]:
+    """
+    Welds the vertices of the regions of all the tiles (see `VertexIndex`) and connects the regions sharing a side.
+
+    :param coords: vertices of all the regions, in the flat layout of `VoronoiPolygons.clip_regions`
+    :param offsets: the vertices of the i-th region are coords[offsets[i]:offsets[i + 1]]
+    returns:
+        vertices, regions, neighbors and intersecions, as returned by `VoronoiPolygons.generate_Voronoi`
+    """
+    # A vertex shared by the regions of a single tile has the same coordinates in all of them,
+    # only the copies computed by different tiles have to be welded.
+    unique, inverse = np.unique(coords, axis=0, return_inverse=True)
+    index = VertexIndex()
+    welded = np.array([index.weld(v) for v in unique], dtype=np.int64)[inverse.ravel()]
+    vertices = index.vertices
+
+    n_regions = len(offsets) - 1
+    region_ids = np.repeat(np.arange(n_regions), np.diff(offsets))
+    regions = [welded[offsets[r]:offsets[r + 1]].tolist() for r in range(n_regions)]
+
+    # Sides of the regions, a side shared by two regions separates neighbors.
+    following = np.arange(1, len(welded) + 1)
+    following[offsets[1:] - 1] = offsets[:-1]
+    v1, v2 = welded, welded[following]
+    keys = np.minimum(v1, v2) * len(vertices) + np.maximum(v1, v2)
+    order = np.argsort(keys, kind='stable')
+    shared = np.flatnonzero(keys[order][1:] == keys[order][:-1])
+    first, second = order[shared], order[shared + 1]
+
+    neighbors = [[] for _ in range(n_regions)]
+    intersecions = [[] for _ in range(n_regions)]
+    for a, b, s in zip(region_ids[first].tolist(), region_ids[second].tolist(), first.tolist()):
+        separator = [int(v1[s]), int(v2[s])]
+        neighbors[a].append(b)
+        intersecions[a].append(separator)
+        neighbors[b].append(a)
+        intersecions[b].append(list(separator))
+
+    # Neighbors are listed by increasing index, as in `VoronoiPolygons.generate_neighbours`.
+    for r in range(n_regions):
+        ordered = np.argsort(neighbors[r], kind='stable')
+        neighbors[r] = [neighbors[r][k] for k in ordered]
+        intersecions[r] = [intersecions[r][k] for k in ordered]
+
+    return vertices, regions, neighbors, intersecions
+
+
+def generate_tiled_graph(
+    N: int,
+    tiles: Union[int, Tuple[int, int]] = 4,
+    iterations: int = 2,
+    seed: int = 0,
+    halo: float = 6.0,
+    workers: Optional[int] = None,
+) -> Graph:
+    """
+    Generates the polygons of a map tile by tile, in parallel, and stitches them into a single graph.
+
+    Every tile is relaxed together with a halo of the points of its neighbours (first phase), then the Voronoi
+    regions of the relaxed points of every tile are computed with a halo of the relaxed points around them
+    (second phase). As Voronoi regions and relaxation are local, a halo wider than a few regions makes the regions
+    of neighbouring tiles agree along their borders. The terrain, elevation, rivers, ... are assigned as usual on
+    the stitched graph.
+
+    :param N: total number of points
+    :param tiles: number of tiles along x and y, or a single number for a square grid
+    :param iterations: number of iterations of Lloyd relaxation
+    :param seed: seed of the points, the result doesn't depend on the number of workers
+    :param halo: width of the halo around a tile, in mean distances between points
+    :param workers: number of worker processes (see `ProcessPoolExecutor`), 1 runs everything in this process
+    """
+    grid = TileGrid(N, tiles=tiles, seed=seed, halo=halo)
+    tiles = grid.tiles
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    try:
+        map_ = executor.map if executor is not None else map
+        relaxed = dict(zip(tiles, map_(
+            _relax_tile, [grid] * len(tiles), *zip(*tiles), [iterations] * len(tiles),
+        )))
+
+        halos = []
+        for i, j in tiles:
+            halo_points = np.concatenate([relaxed[tile] for tile in grid.halo_tiles(i, j)] + [np.zeros((0, 2))])
+            halos.append(halo_points[grid.in_halo(i, j, halo_points)])
+        regions = list(map_(_tile_regions, [relaxed[tile] for tile in tiles], halos))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    points = np.concatenate([relaxed[tile] for tile in tiles])
+    coords = np.concatenate([tile_coords for tile_coords, _ in regions])
+    sizes = np.concatenate([np.diff(tile_offsets) for _, tile_offsets in regions])
+    offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(sizes)
+
+    vertices, regions, neighbors, intersecions = stitch_regions(coords, offsets)
+    arrays = ArrayGraph.from_voronoi(points, vertices, regions, neighbors, intersecions)
+    return Graph.from_arrays(arrays, seed=seed)
@@ -1,10 +1,69 @@
 from __future__ import absolute_import
 import numpy as np
-from typing import Optional, List, Tuple
-import matplotlib.pyplot as plt
-from scipy.spatial import Voronoi, voronoi_plot_2d
+from typing import Callable, Optional, List, Tuple
+from scipy.spatial import Voronoi
 from shapely.geometry import Polygon
 
+from src.rng import randint
+from src.sampling import poisson_disk, quadrant_density
+
+# Ways of drawing the points of the polygons, see `VoronoiPolygons.generate_points`.
+SAMPLINGS = ('uniform', 'poisson')
+
+
+class VertexIndex:
+    """
+    Spatial hash used for welding vertices whose squared distance is at most `max_squared_distance`.
+
+    Vertices are bucketed by their quantized coordinates, so a lookup only has to check the 3x3 block of cells
+    around the queried point. Like the linear scan it replaces, `find` returns the lowest index within the tolerance.
+    """
+
+    def __init__(self, max_squared_distance: float = 1e-14):
+        self._max_squared_distance = max_squared_distance
+        self._cell_size = np.sqrt(max_squared_distance)
+        self._cells = {}
+        self._vertices = []
+
+    def __len__(self):
+        return len(self._vertices)
+
+    @property
+    def vertices(self) -> np.ndarray:
+        return np.array(self._vertices)
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(np.floor(x / self._cell_size)), int(np.floor(y / self._cell_size))
+
+    def add(self, p) -> int:
+        i = len(self._vertices)
+        self._vertices.append(p)
+        self._cells.setdefault(self._cell(p[0], p[1]), []).append(i)
+        return i
+
+    def find(self, p) -> Optional[int]:
+        cx, cy = self._cell(p[0], p[1])
+        found = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in self._cells.get((cx + dx, cy + dy), ()):
+                    if found is not None and i > found:
+                        break
+                    v = self._vertices[i]
+                    if (v[0] - p[0]) ** 2 + (v[1] - p[1]) ** 2 <= self._max_squared_distance:
+                        found = i
+                        break
+        return found
+
+    def weld(self, p) -> int:
+        """
+        Returns the index of the vertex equal to `p`, adding `p` if there is no such vertex yet.
+        """
+        i = self.find(p)
+        if i is None:
+            i = self.add(p)
+        return i
+
 
 class VoronoiPolygons:
     """
@@ -16,18 +75,22 @@ class VoronoiPolygons:
         N: Optional[int] = 25,
         points: Optional[np.ndarray] = None,
         centroids: Optional[np.ndarray] = None,
-        alpha : Optional[float] = 0.2
+        alpha : Optional[float] = 0.2,
+        rng: Optional[np.random.Generator] = None,
+        sampling: str = 'uniform',
+        density: Optional[Callable[[np.ndarray], np.ndarray]] = None,
     ):
         self._points = points
         self._centroids = centroids
+        self._relaxation_iterations = None
 
         if self._points is None:
-            self.generate_points(N=N, alpha=alpha)
+            self.generate_points(N=N, alpha=alpha, rng=rng, sampling=sampling, density=density)
 
         self._vor = Voronoi(self._points)
 
         if self._centroids is None:
-            self.generate_centroids(N=N)
+            self.generate_centroids(N=len(self._points))
 
         self._vor_c = Voronoi(self._centroids)
 
@@ -47,13 +110,41 @@ class VoronoiPolygons:
     def vor_c(self):
         return self._vor_c
 
-    def generate_points(self, N: int, alpha: float) -> None:
-        self._points = np.random.random((int((1-alpha)*N), 2))
+    @property
+    def relaxation_iterations(self):
+        return self._relaxation_iterations
+
+    def generate_points(
+        self,
+        N: int,
+        alpha: float,
+        rng: Optional[np.random.Generator] = None,
+        sampling: str = 'uniform',
+        density: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    ) -> None:
+        """
+        Draws N random points, `alpha` of them in a random quarter of the map.
+        `rng` defaults to the global state `np.random`.
+        :param sampling: 'uniform' for independent points, 'poisson' for about N evenly spaced points
+            (see `src.sampling.poisson_disk`), which need at most a single relaxation iteration
+        :param density: for 'poisson', the relative density of the points instead of the `alpha` quarter
+        """
+        if sampling not in SAMPLINGS:
+            raise ValueError(f'Unexpected sampling: {sampling}')
+        if rng is None:
+            rng = np.random
+        if sampling == 'poisson':
+            if density is None and alpha > 0:
+                corners = np.array([[.5,.5],[.5,.0],[.0,.0],[.0,.5]])
+                density = quadrant_density(alpha, corners[randint(rng, 0, 4)])
+            self._points = poisson_disk(N, rng=rng, density=density)
+            return
+        self._points = rng.random((int((1-alpha)*N), 2))
         if alpha > 0:
             N_ = N - int((1-alpha)*N)
-            new_points = np.random.random((N_, 2))/2
+            new_points = rng.random((N_, 2))/2
             regions = np.array([[.5,.5],[.5,.0],[.0,.0],[.0,.5]])
-            region = regions[np.random.randint(0,4)]
+            region = regions[randint(rng, 0,4)]
             new_points = new_points + region
         self._points = np.vstack((self._points, new_points))
 
@@ -158,17 +249,28 @@ class VoronoiPolygons:
 
     @staticmethod
     def find_new_polygons(
-        vor: Voronoi = None
+        vor: Voronoi = None,
+        dedup: str = 'hash',
     ) -> Tuple[
             List[List[int]],
             List[Tuple[int, int]],
             List[Tuple[int, int]],
          ]:
+        """
+        Clips the regions of `vor` to [0, 1]^2 and welds the vertices of the clipped polygons.
+        `dedup` is either 'hash' (spatial hash, see `VertexIndex`) or 'linear' (scan over all the vertices).
+        """
+        if dedup not in ('hash', 'linear'):
+            raise ValueError(f'Unexpected dedup method: {dedup}')
 
         regions, vertices = VoronoiPolygons.voronoi_finite_polygons_2d(vor=vor)
 
         new_regions = []
         new_vertices = list(vertices.copy())
+        index = VertexIndex()
+        if dedup == 'hash':
+            for v in new_vertices:
+                index.add(v)
 
         box = Polygon([[0, 0], [0, 1], [1, 1], [1, 0]])
 
@@ -178,6 +280,9 @@ class VoronoiPolygons:
             region_elements = []
             for x, y in poly.exterior.coords[:-1]:
                 p = np.array([x, y])
+                if dedup == 'hash':
+                    region_elements.append(index.weld(p))
+                    continue
                 for i, v in enumerate(new_vertices):
                     if np.sum((v - p) ** 2) <= 1e-14:
                         region_elements.append(i)
@@ -187,12 +292,65 @@ class VoronoiPolygons:
                     new_vertices.append(p)
             new_regions.append(region_elements)
 
-        new_vertices = np.array(new_vertices)
+        new_vertices = index.vertices if dedup == 'hash' else np.array(new_vertices)
         new_centroids = np.array([
             new_vertices[region].mean(axis=0) for region in new_regions
         ])
         return new_regions, new_vertices, new_centroids
 
+    @staticmethod
+    def clip_regions(vor: Voronoi, indices: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Clips the regions of `vor` (only the regions of the points `indices`, if given) to [0, 1]^2
+        without welding their vertices.
+
+        Returns the polygons in a flat layout: `coords` holds the vertices of all the polygons one after another
+        and the vertices of the i-th polygon are `coords[offsets[i]:offsets[i + 1]]`.
+        """
+        regions, vertices = VoronoiPolygons.voronoi_finite_polygons_2d(vor=vor)
+        if indices is not None:
+            regions = [regions[i] for i in indices]
+        box = Polygon([[0, 0], [0, 1], [1, 1], [1, 0]])
+
+        rings = [
+            np.asarray(Polygon(vertices[region]).intersection(box).exterior.coords)[:-1]
+            for region in regions
+        ]
+        offsets = np.zeros(len(rings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(ring) for ring in rings])
+        return np.concatenate(rings), offsets
+
+    @staticmethod
+    def polygon_centroids(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+        """
+        Area-weighted centroids of polygons stored in the flat layout of `clip_regions`,
+        computed for all of them at once with the shoelace formula.
+        Degenerate (zero area) polygons fall back to the mean of their vertices.
+        """
+        starts = offsets[:-1]
+        counts = np.diff(offsets)
+
+        # Index of the next vertex of the same polygon.
+        following = np.arange(1, len(coords) + 1)
+        following[offsets[1:] - 1] = starts
+
+        x, y = coords[:, 0], coords[:, 1]
+        x_next, y_next = x[following], y[following]
+        cross = x * y_next - x_next * y
+
+        doubled_area = np.add.reduceat(cross, starts)
+        degenerate = np.abs(doubled_area) < 1e-300
+        denominator = 3 * np.where(degenerate, 1.0, doubled_area)
+        centroids = np.column_stack([
+            np.add.reduceat((x + x_next) * cross, starts) / denominator,
+            np.add.reduceat((y + y_next) * cross, starts) / denominator,
+        ])
+
+        if np.any(degenerate):
+            means = np.add.reduceat(coords, starts) / counts[:, None]
+            centroids[degenerate] = means[degenerate]
+        return centroids
+
     @staticmethod
     def generate_neighbours(
         vor: Voronoi,
@@ -219,14 +377,96 @@ class VoronoiPolygons:
 
         return neighbors, intersecions
 
+    @staticmethod
+    def _ring_order(region: List[int], v1: int, v2: int) -> List[int]:
+        """
+        The two vertices of the region in the order of its ring: the second one follows the first one.
+        """
+        k = region.index(v1)
+        # Welding can repeat a vertex in the ring.
+        while region[(k + 1) % len(region)] == v1:
+            k += 1
+        following = region[(k + 1) % len(region)]
+        return [v1, v2] if following == v2 else [v2, v1]
+
+    @staticmethod
+    def generate_neighbours_from_ridges(
+        vor: Voronoi,
+        regions: List[List[int]],
+        vertices: List[Tuple[int, int]],
+    ):
+        """
+        Same output as `generate_neighbours`, but only the pairs of regions sharing a Voronoi ridge are checked.
+        After clipping, two neighbouring regions share exactly the (deduplicated) vertices of the clipped ridge,
+        so no polygon intersections are needed and the cost is linear in the number of ridges.
+        """
+        neighbors = [[] for i in range(len(regions))]
+        intersecions = [[] for i in range(len(regions))]
+        region_vertices = [set(region) for region in regions]
+
+        for p1, p2 in vor.ridge_points:
+            common = list(dict.fromkeys(v for v in regions[p1] if v in region_vertices[p2]))
+            if len(common) < 2:
+                # The ridge lies outside of the map or the regions touch only in a single point.
+                continue
+            if len(common) > 2:
+                # Collinear vertices on the shared border, keep its two ends.
+                coords = vertices[common]
+                distances = ((coords[:, None, :] - coords[None, :, :]) ** 2).sum(axis=2)
+                i, j = np.unravel_index(distances.argmax(), distances.shape)
+                common = [common[min(i, j)], common[max(i, j)]]
+            v1, v2 = common
+            # Like the intersections of `generate_neighbours`, the border of a region goes in the order of its ring.
+            neighbors[p1].append(p2)
+            intersecions[p1].append(VoronoiPolygons._ring_order(regions[p1], v1, v2))
+            neighbors[p2].append(p1)
+            intersecions[p2].append(VoronoiPolygons._ring_order(regions[p2], v1, v2))
+
+        # Keep the order of `generate_neighbours`, where neighbors are listed by increasing index.
+        for i in range(len(regions)):
+            order = np.argsort(neighbors[i], kind='stable')
+            neighbors[i] = [neighbors[i][k] for k in order]
+            intersecions[i] = [intersecions[i][k] for k in order]
+
+        return neighbors, intersecions
+
+    def relax(
+        self,
+        iterations: int = 2,
+        tolerance: float = 0.0,
+    ) -> int:
+        """
+        Lloyd relaxation: moves every point to the area-weighted centroid of its clipped region.
+
+        params:
+            iterations - maximum number of iterations
+            tolerance - the relaxation stops once no point moves by more than `tolerance`
+        returns:
+            number of iterations actually run
+        """
+        for iteration in range(iterations):
+            coords, offsets = VoronoiPolygons.clip_regions(vor=Voronoi(self._points))
+            centroids = VoronoiPolygons.polygon_centroids(coords, offsets)
+            displacement = np.sqrt(((centroids - self._points) ** 2).sum(axis=1)).max()
+            self._points = centroids
+            if displacement < tolerance:
+                return iteration + 1
+        return iterations
+
     def generate_Voronoi(
         self,
-        iterations: int = 2
+        iterations: int = 2,
+        neighbours_method: str = 'ridges',
+        tolerance: Optional[float] = None,
     ):
         """
         params:
             N - number of points
             iterations - number of iterations for relaxation process
+            neighbours_method - 'ridges' to take the neighbors from the Voronoi ridges,
+                'intersections' for the (quadratic) pairwise polygon intersections
+            tolerance - if given, the points are relaxed with `relax` (area-weighted centroids) which stops once
+                no point moves by more than `tolerance`, otherwise every iteration uses the vertex-mean centroids
         returns:
             points - list of final points
             centroids - list of centroids of the regions
@@ -236,12 +476,27 @@ class VoronoiPolygons:
             intersecions - indexes of vertices creating line separating each two neighbors
         """
         
-        for iter in range(iterations + 1):
+        if tolerance is None:
+            for iter in range(iterations + 1):
+                self._vor = Voronoi(self._points)
+                new_regions, new_vertices, new_centroids = \
+                    VoronoiPolygons.find_new_polygons(vor=self._vor)
+                self._points = new_centroids
+            self._relaxation_iterations = iterations
+        else:
+            self._relaxation_iterations = self.relax(iterations=iterations, tolerance=tolerance)
             self._vor = Voronoi(self._points)
             new_regions, new_vertices, new_centroids = \
                 VoronoiPolygons.find_new_polygons(vor=self._vor)
             self._points = new_centroids
-        neighbors, intersecions = VoronoiPolygons.generate_neighbours(
+
+        if neighbours_method == 'ridges':
+            generate_neighbours = VoronoiPolygons.generate_neighbours_from_ridges
+        elif neighbours_method == 'intersections':
+            generate_neighbours = VoronoiPolygons.generate_neighbours
+        else:
+            raise ValueError(f'Unexpected neighbours method: {neighbours_method}')
+        neighbors, intersecions = generate_neighbours(
             vor=self._vor,
             regions=new_regions,
             vertices=new_vertices,
@@ -252,24 +507,11 @@ class VoronoiPolygons:
     def plot_Voronoi_grid(
         points, vertices, regions, neighbors, centroids=None
     ):
-        plt.figure(figsize=(10, 10))
-        plt.rcParams['axes.facecolor'] = 'grey'
-        for region in regions:
-            region.append(region[0])
-            coords = vertices[region]
-            plt.plot(coords[:, 0], coords[:, 1], c='white')
-        for i, n_list in enumerate(neighbors):
-            p1 = points[i]
-            for i2 in n_list:
-                p2 = points[i2]
-                plt.plot([p1[0], p2[0]], [p1[1], p2[1]], c='black')
-        plt.scatter(points[:, 0], points[:, 1], c='red')
-        plt.scatter(vertices[:, 0], vertices[:, 1], c='blue')
-        if centroids is not None:
-            plt.scatter(centroids[:, 0], centroids[:, 1], c='green')
-        plt.xlim(0, 1)
-        plt.ylim(0, 1)
-        plt.show()
+        """
+        Plots the polygons, the neighbours and the points with matplotlib, see `src.render.plot_Voronoi_grid`.
+        """
+        from src import render
+        render.plot_Voronoi_grid(points, vertices, regions, neighbors, centroids)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,290 @@
+"""
+The stages of `ArrayGraph` compared with the original loops over the objects of `Graph`.
+"""
+import math
+from collections import deque
+
+import numpy as np
+import pytest
+
+from src.map import Graph
+from src.terrain import assign_terrain_types_to_graph, classify_biomes, BiomeType, TerrainType
+
+SEEDS = [0, 1, 2]
+
+
+def terrain_graph(seed, N=300):
+    graph = Graph(N=N, seed=seed)
+    assign_terrain_types_to_graph(graph)
+    return graph
+
+
+def reference_corner_elevations(graph):
+    """
+    A BFS from every border corner, a step costs 0.01 plus 1 between two corners which are not water.
+    """
+    height = {corner: float('inf') for corner in graph.corners}
+    water = (TerrainType.OCEAN, TerrainType.LAKE)
+    for border in graph.corners:
+        if not (border.x == 0 or border.x == 1 or border.y == 0 or border.y == 1):
+            continue
+        height[border] = 0
+        queue = deque([border])
+        while queue:
+            current = queue.popleft()
+            for adjacent in current.adjacent:
+                new_elevation = height[current] + 0.01
+                if current.terrain_type not in water and adjacent.terrain_type not in water:
+                    new_elevation += 1
+                if height[adjacent] > new_elevation:
+                    height[adjacent] = new_elevation
+                    queue.append(adjacent)
+    return [height[corner] - (corner.terrain_type is TerrainType.LAKE) for corner in graph.corners]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_corner_elevations_match_reference(seed):
+    graph = terrain_graph(seed)
+    expected = reference_corner_elevations(graph)
+
+    graph.assign_corner_elevations()
+
+    np.testing.assert_allclose([corner.height for corner in graph.corners], expected, rtol=0, atol=1e-9)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_equally_distant_corners_tie_exactly(seed):
+    graph = terrain_graph(seed)
+    graph.assign_corner_elevations()
+    heights = np.array([corner.height for corner in graph.corners])
+
+    # The distances are whole hundredths, so the corners at the same distance have exactly the same height.
+    np.testing.assert_array_equal(heights, np.round(heights * 100) / 100)
+    assert len(np.unique(heights)) < len(heights)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_redistributed_ties_keep_the_corner_order(seed):
+    graph = terrain_graph(seed)
+    graph.assign_corner_elevations()
+    heights = [corner.height for corner in graph.corners]
+
+    graph.redistribute_elevations(scale_factor=1.1)
+
+    # The sort is stable: the corners of equal heights are ranked in the order of the corners.
+    order = sorted(range(len(heights)), key=lambda i: (heights[i], i))
+    expected = [
+        math.sqrt(1.1) - math.sqrt(1.1 * (1 - rank / len(heights))) for rank in range(len(heights))
+    ]
+    assert [graph.corners[i].height for i in order] == expected
+
+
+def elevation_graph(seed, N=300):
+    graph = terrain_graph(seed, N)
+    graph.assign_corner_elevations()
+    graph.redistribute_elevations()
+    graph.assign_center_elevations()
+    return graph
+
+
+def river_graph(seed, N=300):
+    graph = elevation_graph(seed, N)
+    graph.create_rivers(n=10, min_height=0.5)
+    return graph
+
+
+def reference_rivers(graph, n, min_height, rng):
+    """
+    Every river walked on its own down the lowest adjacent corners, then the rivers of the corners
+    with the original quirk: the second end of an edge gets the river of the first one if it's bigger.
+    """
+    land = (TerrainType.LAND, TerrainType.COAST)
+
+    def suitable_for_river(corner):
+        return corner.terrain_type in land \
+            and all(adjacent.terrain_type in land for adjacent in corner.adjacent) \
+            and all(center.terrain_type in land for center in corner.touches)
+
+    beginnings = [
+        corner for corner in graph.corners
+        if (corner.terrain_type in land and corner.height >= min_height)
+        or (any(center.terrain_type is TerrainType.LAKE for center in corner.touches)
+            and corner.terrain_type is not TerrainType.LAKE)
+    ]
+    edge_river = {edge: 0 for edge in graph.edges}
+    for i in rng.choice(len(beginnings), n, replace=False):
+        corner = beginnings[i]
+        for _ in graph.corners:
+            if not suitable_for_river(corner):
+                break
+            heights = [adjacent.height for adjacent in corner.adjacent]
+            next_corner = corner.adjacent[heights.index(min(heights))]
+            if next_corner.terrain_type not in land:
+                break
+            edge_river[graph.find_edge_using_corners(corner, next_corner)] += 1
+            corner = next_corner
+        else:
+            raise AssertionError('the river goes round in a cycle')
+
+    corner_river = {corner: 0 for corner in graph.corners}
+    for edge in graph.edges:
+        if edge_river[edge] > 0:
+            corner_river[edge.v0] = max(corner_river[edge.v0], edge_river[edge])
+            corner_river[edge.v1] = max(corner_river[edge.v0], edge_river[edge])
+    return [edge_river[edge] for edge in graph.edges], [corner_river[corner] for corner in graph.corners]
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('n', [1, 10, 40])
+def test_rivers_match_reference(seed, n):
+    graph = elevation_graph(seed)
+    edge_river, corner_river = reference_rivers(graph, n, 0.5, np.random.default_rng(seed))
+
+    graph.create_rivers(n=n, min_height=0.5, rng=np.random.default_rng(seed))
+
+    assert [edge.river for edge in graph.edges] == edge_river
+    assert [corner.river for corner in graph.corners] == corner_river
+    # Rivers join, so some edges carry more than one.
+    assert n == 1 or max(edge_river) > 1
+
+
+def reference_moisture(graph, distance_decay=0.9, river_weight=0.25, lake_value=1.0, ocean_value=1.0):
+    """
+    A queue of the corners whose moisture grew, then the means of the land centers and their ranks.
+    """
+    moisture = {corner: 0.0 for corner in graph.corners}
+    queue = deque()
+    for corner in graph.corners:
+        if corner.river > 0:
+            moisture[corner] = max(1.0, min(3.0, river_weight * corner.river))
+        if any(center.terrain_type is TerrainType.LAKE for center in corner.touches):
+            moisture[corner] = max(lake_value, moisture[corner])
+        if moisture[corner] > 0:
+            queue.append(corner)
+    while queue:
+        corner = queue.popleft()
+        new_moisture = distance_decay * moisture[corner]
+        for adjacent in corner.adjacent:
+            if new_moisture > moisture[adjacent]:
+                moisture[adjacent] = new_moisture
+                queue.append(adjacent)
+    for corner in graph.corners:
+        if any(center.terrain_type is TerrainType.OCEAN for center in corner.touches):
+            moisture[corner] = max(ocean_value, moisture[corner])
+
+    center_moisture = [
+        np.mean([min(1.0, moisture[corner]) for corner in center.corners])
+        if center.terrain_type in (TerrainType.LAND, TerrainType.COAST) else 0.0
+        for center in graph.centers
+    ]
+    order = sorted(range(len(center_moisture)), key=lambda i: center_moisture[i])
+    redistributed = [0.0] * len(center_moisture)
+    for rank, i in enumerate(order):
+        redistributed[i] = rank / (len(order) - 1)
+    return [moisture[corner] for corner in graph.corners], center_moisture, redistributed
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('distance_decay', [0.9, 0.5])
+def test_moisture_matches_reference(seed, distance_decay):
+    graph = river_graph(seed)
+    corner_moisture, center_moisture, redistributed = reference_moisture(graph, distance_decay=distance_decay)
+
+    graph.assign_moisture(redistribute=False, distance_decay=distance_decay)
+    assert [corner.moisture for corner in graph.corners] == corner_moisture
+    np.testing.assert_allclose([center.moisture for center in graph.centers], center_moisture, rtol=1e-12)
+
+    graph.assign_moisture(redistribute=True, distance_decay=distance_decay)
+    assert [center.moisture for center in graph.centers] == redistributed
+
+
+def reference_biome(terrain, height, moisture, coast_neighbour):
+    """
+    The original if/elif tree of the biomes.
+    """
+    if terrain is TerrainType.COAST:
+        return BiomeType.COAST
+    elif terrain is TerrainType.OCEAN:
+        return BiomeType.OCEAN if coast_neighbour else BiomeType.DEEPOCEAN
+    elif terrain is TerrainType.LAKE:
+        if height < 0.2:
+            return BiomeType.MARSH
+        elif height > 0.9:
+            return BiomeType.ICE
+        return BiomeType.LAKE
+    if height > 0.87:
+        if moisture > 0.66:
+            return BiomeType.SNOW
+        elif moisture > 0.44:
+            return BiomeType.TUNDRA
+        elif moisture > 0.22:
+            return BiomeType.BARE
+        return BiomeType.SCORCHED
+    elif height > 0.66:
+        if moisture > 0.66:
+            return BiomeType.TAIGA
+        elif moisture > 0.33:
+            return BiomeType.SHRUBLAND
+        return BiomeType.TEMPERATE_DESERT
+    elif height > 0.4:
+        if moisture > 0.8:
+            return BiomeType.TEMPERATE_RAIN_FOREST
+        elif moisture > 0.6:
+            return BiomeType.TEMPERATE_DECIDOUS_FOREST
+        elif moisture > 0.3:
+            return BiomeType.GRASSLAND
+        return BiomeType.TEMPERATE_DESERT
+    if moisture > 0.66:
+        return BiomeType.TROPICAL_RAIN_FOREST
+    elif moisture > 0.45:
+        return BiomeType.TROPICAL_SEASONAL_FOREST
+    elif moisture > 0.3:
+        return BiomeType.GRASSLAND
+    return BiomeType.SUBTROPICAL_DESERT
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_biomes_match_reference(seed):
+    graph = river_graph(seed)
+    graph.assign_moisture()
+    expected = [
+        reference_biome(
+            center.terrain_type, center.height, center.moisture,
+            any(neighbor.terrain_type is TerrainType.COAST for neighbor in center.neighbors),
+        )
+        for center in graph.centers
+    ]
+
+    graph.assign_biomes()
+
+    assert [center.biome for center in graph.centers] == expected
+
+
+def test_classify_biomes_on_the_bounds():
+    # Every pair of the bounds of the table (and the values around them) for every terrain type.
+    values = np.array([0.0, 0.2, 0.22, 0.3, 0.33, 0.4, 0.44, 0.45, 0.6, 0.66, 0.8, 0.87, 0.9, 1.0])
+    values = np.unique(np.concatenate([values, np.nextafter(values, -1), np.nextafter(values, 2)]))
+    terrain, height, moisture, coast = (
+        grid.ravel() for grid in np.meshgrid([t.value for t in TerrainType], values, values, [False, True])
+    )
+
+    biomes = classify_biomes(terrain, height, moisture, coast)
+
+    expected = [
+        reference_biome(TerrainType(t), h, m, c).value
+        for t, h, m, c in zip(terrain.tolist(), height.tolist(), moisture.tolist(), coast.tolist())
+    ]
+    assert biomes.tolist() == expected
+
+
+def test_classify_biomes_nan_falls_to_the_driest_biome():
+    # A NaN fails every comparison of the original tree, so it ends in the last else branches.
+    nan = float('nan')
+    height = np.array([0.9, 0.7, 0.5, 0.1, nan, nan, 0.9, 0.1])
+    moisture = np.array([nan, nan, nan, nan, nan, 0.9, 0.9, 0.9])
+    terrain = np.full(len(height), TerrainType.LAND.value)
+
+    biomes = classify_biomes(terrain, height, moisture, np.zeros(len(height), dtype=bool))
+
+    expected = [reference_biome(TerrainType.LAND, h, m, False).value for h, m in zip(height, moisture)]
+    assert biomes.tolist() == expected
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+
+from src.cache import StageCache
+
+
+def arrays(value, n=10):
+    return {'column': np.full(n, value, dtype=np.int64)}
+
+
+def test_remembering_a_key_again_makes_it_most_recently_used():
+    cache = StageCache(memory_bytes=2 * 80)
+    cache.put('a', arrays(1))
+    cache.put('b', arrays(2))
+
+    cache.put('a', arrays(1))
+    cache.put('c', arrays(3))
+
+    assert 'a' in cache._memory and 'b' not in cache._memory
+    assert cache._memory_size == 2 * 80
+
+
+def test_write_of_an_existing_key_keeps_the_disk_size(tmp_path):
+    cache = StageCache(directory=str(tmp_path))
+    cache.put('a', arrays(1))
+    size = cache._disk_size
+
+    # As if another process had written the key between the check of `put` and the rename.
+    cache._write('a', arrays(1))
+
+    assert list(cache._disk) == ['a']
+    assert cache._disk_size == size == sum(
+        os.path.getsize(os.path.join(tmp_path, 'a', name)) for name in os.listdir(os.path.join(tmp_path, 'a'))
+    )
+
+
+def test_failed_write_is_not_counted(tmp_path, monkeypatch):
+    cache = StageCache(directory=str(tmp_path))
+
+    def rename(source, destination):
+        raise PermissionError(destination)
+    monkeypatch.setattr(os, 'rename', rename)
+    cache.put('a', arrays(1))
+
+    assert 'a' not in cache._disk and cache._disk_size == 0
+    assert os.listdir(tmp_path) == []
+    assert cache.get('a') is not None
@@ -0,0 +1,138 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from src.map import Graph
+from src.stats import GenerationStats
+from src.rng import randint
+from src.terrain import (
+    _EdgeList,
+    assign_terrain_types_to_graph,
+    TerrainType,
+    MIN_WATER_EDGES_RATIO_TO_BE_WATER_CENTER,
+    CHANCE_OF_WATER_EDGE_IN_MIDDLE,
+    OCEAN_TO_TOTAL_RATIO,
+    LAKE_TO_TOTAL_RATIO,
+)
+
+REGIONS = np.array([[0.2, 0.2], [0.2, 0.4], [0.2, 0.6], [0.2, 0.8], [0.2, 1.], [0.4, 0.2], [0.4, 1.], [0.6, 0.2],
+                    [0.6, 1.], [0.8, 0.2], [0.8, 1.], [1., 0.2], [1., 0.4], [1., 0.6], [1., 0.8], [1., 1.]])
+
+
+def reference_terrain_types(
+    graph, rng, chance_of_water_edge_in_middle=CHANCE_OF_WATER_EDGE_IN_MIDDLE, lake_to_total_ratio=LAKE_TO_TOTAL_RATIO,
+):
+    """
+    The original algorithm, on lists of the edges, drawing the same numbers from `rng`.
+    Returns the terrain types of the centers and the number of the water edges.
+    """
+    actual_regions_ids = randint(rng, 0, len(REGIONS), 3)
+
+    def is_good_beginner(edge):
+        if edge.is_edge_to_map_end():
+            return True
+        for region_id in actual_regions_ids:
+            region = REGIONS[region_id]
+            if region[0]-0.2 <= edge.v0.x <= region[0] \
+              and region[1]-0.2 <= edge.v0.y <= region[1] \
+              and rng.random() < 0.5:
+                return True
+        return False
+
+    water_edges = [edge for edge in graph.edges if is_good_beginner(edge)]
+    unexpanded_water_edges = water_edges
+    ocean_edges_expected = int(len(graph.edges) * (OCEAN_TO_TOTAL_RATIO + (rng.random() - 0.5) / 10))
+    while len(water_edges) < ocean_edges_expected:
+        selected_edge = unexpanded_water_edges[randint(rng, len(unexpanded_water_edges))]
+        unexpanded_water_edges.remove(selected_edge)
+        for corner in [selected_edge.v0, selected_edge.v1]:
+            for edge in corner.protrudes:
+                if edge not in water_edges:
+                    water_edges.append(edge)
+                    unexpanded_water_edges.append(edge)
+
+    lake_edges_expected = ocean_edges_expected + int(len(graph.edges) * lake_to_total_ratio)
+    unexpanded_water_edges = [edge for edge in graph.edges
+                              if edge not in water_edges and chance_of_water_edge_in_middle > rng.random()]
+    while len(water_edges) < lake_edges_expected:
+        selected_edge = unexpanded_water_edges[randint(rng, len(unexpanded_water_edges))]
+        unexpanded_water_edges.remove(selected_edge)
+        for corner in [selected_edge.v0, selected_edge.v1]:
+            for edge in corner.protrudes:
+                if edge not in water_edges:
+                    water_edges.append(edge)
+                    unexpanded_water_edges.append(edge)
+
+    terrain = {center: TerrainType.LAND for center in graph.centers}
+    unexpanded_ocean_centers = deque()
+    for center in graph.centers:
+        if np.mean([border in water_edges for border in center.borders]) >= MIN_WATER_EDGES_RATIO_TO_BE_WATER_CENTER:
+            terrain[center] = TerrainType.LAKE
+            if any([edge.is_edge_to_map_end() for edge in center.borders]):
+                unexpanded_ocean_centers.append(center)
+    while len(unexpanded_ocean_centers) > 0:
+        center = unexpanded_ocean_centers.popleft()
+        terrain[center] = TerrainType.OCEAN
+        for neighbor in center.neighbors:
+            if terrain[neighbor] is TerrainType.LAKE:
+                unexpanded_ocean_centers.append(neighbor)
+    for center in graph.centers:
+        if terrain[center] is TerrainType.LAND \
+          and any(terrain[neighbor] is TerrainType.OCEAN for neighbor in center.neighbors):
+            terrain[center] = TerrainType.COAST
+    return [terrain[center] for center in graph.centers], len(set(water_edges))
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+@pytest.mark.parametrize('N', [100, 400])
+def test_terrain_types_match_reference(seed, N):
+    graph = Graph(N=N, seed=seed)
+    expected, _ = reference_terrain_types(graph, np.random.default_rng(seed))
+
+    assign_terrain_types_to_graph(graph, rng=np.random.default_rng(seed))
+
+    assert [center.terrain_type for center in graph.centers] == expected
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_lake_terrain_types_match_reference(seed):
+    # Many lake beginners, so that lakes often reach the beginners of other lakes.
+    params = dict(chance_of_water_edge_in_middle=0.2, lake_to_total_ratio=0.3)
+    graph = Graph(N=400, seed=seed)
+    expected, _ = reference_terrain_types(graph, np.random.default_rng(seed), **params)
+
+    assign_terrain_types_to_graph(graph, rng=np.random.default_rng(seed), **params)
+
+    assert [center.terrain_type for center in graph.centers] == expected
+
+
+def test_edge_list_matches_list():
+    rng = np.random.default_rng(0)
+    expected = list(rng.integers(0, 100, 1000))
+    edges = _EdgeList(expected)
+    for _ in range(5000):
+        if rng.random() < 0.5 and expected:
+            k = int(rng.integers(len(expected)))
+            block, position = edges.find(k)
+            assert edges.blocks[block][position] == expected[k]
+            edges.remove(block, position)
+            del expected[k]
+        else:
+            edge = int(rng.integers(100))
+            edges.append(edge)
+            expected.append(edge)
+        assert len(edges) == len(expected)
+    assert [edge for block in edges.blocks for edge in block] == expected
+
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_water_edges_stat_counts_every_edge_once(seed):
+    graph = Graph(N=400, seed=seed)
+    _, water_edges = reference_terrain_types(graph, np.random.default_rng(seed))
+
+    graph.stats = GenerationStats()
+    assign_terrain_types_to_graph(graph, rng=np.random.default_rng(seed))
+
+    assert graph.stats['terrain'].counts['water_edges'] == water_edges
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from scipy.spatial import Voronoi
+
+from src.voronoi import VoronoiPolygons
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('N', [10, 100, 400])
+def test_find_new_polygons_hash_matches_linear(seed, N):
+    vor = Voronoi(np.random.default_rng(seed).random((N, 2)))
+
+    hash_regions, hash_vertices, hash_centroids = VoronoiPolygons.find_new_polygons(vor, dedup='hash')
+    linear_regions, linear_vertices, linear_centroids = VoronoiPolygons.find_new_polygons(vor, dedup='linear')
+
+    assert hash_regions == linear_regions
+    np.testing.assert_array_equal(hash_vertices, linear_vertices)
+    np.testing.assert_array_equal(hash_centroids, linear_centroids)
+
+
+def test_find_new_polygons_unexpected_dedup():
+    vor = Voronoi(np.random.default_rng(0).random((10, 2)))
+    with pytest.raises(ValueError):
+        VoronoiPolygons.find_new_polygons(vor, dedup='tree')
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('N', [10, 100, 300])
+def test_neighbours_from_ridges_match_intersections(seed, N):
+    vor = Voronoi(np.random.default_rng(seed).random((N, 2)))
+    regions, vertices, _ = VoronoiPolygons.find_new_polygons(vor)
+
+    expected = VoronoiPolygons.generate_neighbours(vor, regions, vertices)
+    neighbors, intersecions = VoronoiPolygons.generate_neighbours_from_ridges(vor, regions, vertices)
+
+    assert neighbors == expected[0]
+    assert intersecions == [[[int(v1), int(v2)] for v1, v2 in border] for border in expected[1]]